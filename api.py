@@ -0,0 +1,390 @@
+"""
+Life Gamification - HTTP API для логування задач з автоматизацій (шорткати, трекери, cron)
+Запуск: python api.py [--host 127.0.0.1] [--port 8502]
+        python api.py --bench [--requests 5000] [--concurrency 50]
+Токен доступу (необов'язково): змінна оточення GAMIFY_API_TOKEN, заголовок Authorization: Bearer <токен>.
+PostgreSQL: як і застосунок - STREAMLIT_SHARING_MODE + secrets або GAMIFY_PG_URL.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import main
+
+API_POOL_SIZE = 8
+# Одиночні запити, що накопичились, поки писалась попередня пачка (плюс необов'язкове вікно очікування),
+# пишуться однією транзакцією
+BATCH_WINDOW = 0.0
+BATCH_MAX = 200
+# Як довго довіряти кешованому довіднику типів задач
+CATALOG_TTL = 30
+MAX_BODY = 1 << 20
+STATUSES = ('Done', 'Failed', 'Skipped')
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class CommitFailed(Exception):
+    """Коміт пачки впав: чи дійшов він до БД, невідомо, тож задачі пачки вже не повторюємо"""
+
+class Pool:
+    """Пул з'єднань: ThreadedConnectionPool для PostgreSQL, черга готових з'єднань для SQLite"""
+
+    def __init__(self, size=API_POOL_SIZE):
+        if main.IS_CLOUD:
+            from psycopg2.pool import ThreadedConnectionPool
+            self.pg = ThreadedConnectionPool(1, size, main.get_database_url())
+        else:
+            self.pg = None
+            self.idle = queue.Queue()
+            for _ in range(size):
+                self.idle.put(main.get_connection())
+
+    def run(self, func, *args):
+        """func(conn, *args) на з'єднанні з пулу; незакомічене відкочується перед поверненням у пул"""
+        conn = self.pg.getconn() if self.pg else self.idle.get()
+        try:
+            return func(conn, *args)
+        finally:
+            conn.rollback()
+            if self.pg:
+                self.pg.putconn(conn)
+            else:
+                self.idle.put(conn)
+
+def parse_task(data, piece_tiers):
+    """Перевіряє JSON задачі і доповнює значеннями за замовчуванням"""
+    if not isinstance(data, dict):
+        raise ApiError(400, "Задача должна быть объектом")
+    piece_type = data.get('piece_type')
+    if piece_type not in piece_tiers:
+        raise ApiError(400, f"Неизвестный тип задачи: {piece_type}")
+    front_code, tier = piece_tiers[piece_type]
+    if data.get('front_code', front_code) != front_code:
+        raise ApiError(400, f"Задача {piece_type} относится к фронту {front_code}")
+
+    task = {
+        'date': data.get('date') or datetime.now().strftime('%Y-%m-%d'),
+        'front_code': front_code,
+        'tier': data.get('tier') or tier,
+        'piece_type': piece_type,
+        'note': data.get('note') or '',
+        'minutes': data.get('minutes', 0),
+        'difficulty': data.get('difficulty', 2),
+        'status': data.get('status', 'Done'),
+    }
+    try:
+        datetime.strptime(task['date'], '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ApiError(400, "Дата должна быть в формате YYYY-MM-DD")
+    if task['tier'] not in main.TIERS:
+        raise ApiError(400, f"Тир должен быть одним из {', '.join(main.TIERS)}")
+    if task['status'] not in STATUSES:
+        raise ApiError(400, f"Статус должен быть одним из {', '.join(STATUSES)}")
+    if not isinstance(task['minutes'], int) or not 0 <= task['minutes'] <= 1440:
+        raise ApiError(400, "Минуты - целое число от 0 до 1440")
+    if not isinstance(task['difficulty'], int) or not 1 <= task['difficulty'] <= 5:
+        raise ApiError(400, "Сложность - целое число от 1 до 5")
+    return task
+
+def load_piece_tiers(conn):
+    c = conn.cursor()
+    c.execute("SELECT code, front_code, tier FROM piece_types")
+    return {code: (front_code, tier) for code, front_code, tier in c.fetchall()}
+
+def log_tasks(conn, tasks):
+    """Пачка задач однією транзакцією через рушій main.py: [{'id', 'total_xp', 'coins', 'bonus'}]"""
+    c = conn.cursor()
+    c.execute("SELECT code, weight FROM fronts")
+    weights = dict(c.fetchall())
+    overall_xp = main.get_overall_xp(conn)
+    level = main.get_level(overall_xp, conn)
+
+    results = []
+    for task in tasks:
+        total_xp = main.calc_task_xp(task, conn)
+        values = (task['date'], task['front_code'], task['tier'], task['piece_type'],
+                  task['note'], task['minutes'], task['difficulty'], task['status'], total_xp, total_xp)
+        if main.IS_CLOUD:
+            c.execute("""INSERT INTO tasks (date, front_code, tier, piece_type, note, minutes, difficulty, status, total_xp, coins_earned)
+                         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""", values)
+            task_id = c.fetchone()[0]
+        else:
+            c.execute("""INSERT INTO tasks (date, front_code, tier, piece_type, note, minutes, difficulty, status, total_xp, coins_earned)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", values)
+            task_id = c.lastrowid
+        main.update_stats(conn, task['front_code'], task['tier'], task['status'], task['date'], 1)
+        overall_xp += total_xp * weights.get(task['front_code'], 0)
+        # Бонус за рівень - у тій самій транзакції: кожен перехід рівня дістається задачі, що його дала
+        new_level = main.get_level(overall_xp, conn)
+        bonus = main.award_levelup_bonus(conn, level, new_level)
+        level = max(level, new_level)
+        results.append({'id': task_id, 'total_xp': total_xp, 'coins': total_xp, 'bonus': bonus})
+    main.add_coins(conn, sum(r['total_xp'] for r in results))
+    main.bump_data_version(conn)
+    # Коміт - останній крок: усе, що впало до нього, відкочується цілком, і пачку можна повторити
+    try:
+        conn.commit()
+    except Exception as e:
+        raise CommitFailed(str(e)) from e
+    return results
+
+def load_balance(conn):
+    return {'coins': main.get_total_coins(conn)}
+
+def load_level(conn, front_code=None):
+    if front_code:
+        front = main.load_front(conn, front_code)
+        if not front:
+            raise ApiError(404, f"Фронт не найден: {front_code}")
+        xp, level = front['xp'], front['level']
+    else:
+        xp = main.get_overall_xp(conn)
+        level = main.get_level(xp, conn)
+    return {'xp': xp, 'level': level, 'next_threshold': main.get_next_threshold(level, conn)}
+
+class TaskBatcher:
+    """Збирає одиночні запити на логування в пачки: одна транзакція і один коміт на пачку.
+    Пише один воркер - паралельні транзакції лише сварилися б за блокування статистики"""
+
+    def __init__(self, pool, executor, window=BATCH_WINDOW, max_size=BATCH_MAX):
+        self.pool = pool
+        self.executor = executor
+        self.window = window
+        self.max_size = max_size
+        self.queue = None
+        self.worker = None
+
+    async def submit(self, task):
+        loop = asyncio.get_running_loop()
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self.run())
+        future = loop.create_future()
+        await self.queue.put((task, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.pool.run, log_tasks, [t for t, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except CommitFailed as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            except Exception:
+                # Одна погана задача не повинна валити сусідів по пачці - повторюємо поодинці
+                for task, future in batch:
+                    try:
+                        result = await loop.run_in_executor(self.executor, self.pool.run, log_tasks, [task])
+                        future.set_result(result[0])
+                    except Exception as e:
+                        future.set_exception(e)
+
+class IngestApp:
+    """ASGI-застосунок: POST /tasks, POST /tasks/batch, GET /balance, GET /level[?front=код], GET /health"""
+
+    def __init__(self, pool_size=API_POOL_SIZE, batch_window=BATCH_WINDOW, batch_max=BATCH_MAX,
+                 token=os.environ.get('GAMIFY_API_TOKEN')):
+        self.pool_size = pool_size
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.token = token
+        self.pool = None
+        self.catalog = ({}, 0)
+        self.routes = {
+            ('POST', '/tasks'): self.post_task,
+            ('POST', '/tasks/batch'): self.post_batch,
+            ('GET', '/balance'): self.get_balance,
+            ('GET', '/level'): self.get_level,
+            ('GET', '/health'): self.get_health,
+        }
+
+    def start(self):
+        if self.pool is None:
+            conn = main.init_database()
+            main.seed_data(conn)
+            conn.close()
+            self.pool = Pool(self.pool_size)
+            self.executor = ThreadPoolExecutor(self.pool_size)
+            self.batcher = TaskBatcher(self.pool, self.executor, self.batch_window, self.batch_max)
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.pool.run, func, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    self.start()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        self.start()
+        try:
+            # /health відкритий для перевірок живості балансувальника
+            if self.token and scope['path'] != '/health':
+                headers = dict(scope.get('headers') or [])
+                if headers.get(b'authorization', b'').decode() != f"Bearer {self.token}":
+                    raise ApiError(401, "Нужен токен")
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler is None:
+                raise ApiError(404, "Нет такого адреса")
+            query = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+            status, payload = 200, await handler(await self.read_json(receive, scope['method']), query)
+        except ApiError as e:
+            status, payload = e.status, {'error': e.message}
+        except Exception as e:
+            status, payload = 503, {'error': f"{type(e).__name__}: {e}"}
+
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json; charset=utf-8'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def read_json(self, receive, method):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY:
+                raise ApiError(413, "Слишком большой запрос")
+            if not message.get('more_body'):
+                break
+        if method != 'POST':
+            return None
+        try:
+            return json.loads(body or b'null')
+        except ValueError:
+            raise ApiError(400, "Тело запроса - не JSON")
+
+    async def piece_tiers(self, codes=()):
+        """Довідник типів задач; перечитується за TTL або коли запит згадує невідомий тип"""
+        piece_tiers, loaded = self.catalog
+        if time.time() - loaded > CATALOG_TTL or any(code not in piece_tiers for code in codes):
+            piece_tiers = await self.call(load_piece_tiers)
+            self.catalog = (piece_tiers, time.time())
+        return piece_tiers
+
+    async def post_task(self, data, query):
+        codes = [data.get('piece_type')] if isinstance(data, dict) else []
+        task = parse_task(data, await self.piece_tiers(codes))
+        return await self.batcher.submit(task)
+
+    async def post_batch(self, data, query):
+        items = data.get('tasks') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items or len(items) > BATCH_MAX:
+            raise ApiError(400, f"Нужен список tasks из 1-{BATCH_MAX} задач")
+        piece_tiers = await self.piece_tiers([item.get('piece_type') for item in items if isinstance(item, dict)])
+        tasks = [parse_task(item, piece_tiers) for item in items]
+        return {'results': await self.call(log_tasks, tasks)}
+
+    async def get_balance(self, data, query):
+        return await self.call(load_balance)
+
+    async def get_level(self, data, query):
+        return await self.call(load_level, query.get('front'))
+
+    async def get_health(self, data, query):
+        return {'ok': True}
+
+app = IngestApp()
+
+async def request(app, method, path, payload=None, query=''):
+    """Виклик ASGI-застосунку в тому ж процесі, без мережі: (status, json)"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+               'headers': [(b'authorization', f"Bearer {app.token}".encode())] if app.token else []},
+              receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+async def bench(app, requests, concurrency):
+    """Стійка пропускна здатність POST /tasks: concurrency клієнтів шлють запити без пауз"""
+    app.start()
+    pieces = list((await app.piece_tiers()).items())
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def client(n):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            code, (front_code, tier) = pieces[(remaining * 7919 + n) % len(pieces)]
+            begin = time.perf_counter()
+            status, _ = await request(app, 'POST', '/tasks', {'piece_type': code, 'minutes': 10})
+            latencies.append(time.perf_counter() - begin)
+            errors += status != 200
+
+    began = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    wall = time.perf_counter() - began
+    latencies.sort()
+    print(f"{'PostgreSQL' if main.IS_CLOUD else 'SQLite'}: {requests} запросов, {concurrency} клиентов, "
+          f"пачки до {app.batch_max}, окно {app.batch_window * 1000:.0f} мс")
+    print(f"  {requests / wall:.0f} запросов/с, p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс, ошибок {errors}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API Life Gamification")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--bench', action='store_true', help="замерить пропускную способность (SQLite - во временной базе)")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW * 1000, help="окно пачки, мс (0 - без ожидания)")
+    parser.add_argument('--batch-max', type=int, default=BATCH_MAX, help="задач в пачке (1 - без пачек)")
+    args = parser.parse_args()
+
+    app.batch_window = args.batch_window / 1000
+    app.batch_max = args.batch_max
+    if args.bench:
+        if not main.IS_CLOUD:
+            main.DB_PATH = Path(tempfile.mkdtemp()) / "xp.db"
+        asyncio.run(bench(app, args.requests, args.concurrency))
+    else:
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port)
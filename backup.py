@@ -0,0 +1,258 @@
+"""
+Life Gamification - резервні копії без зупинки застосунку
+Запуск: python backup.py [--keep N] [--pg-url URL]
+        python backup.py --list
+        python backup.py --restore 20250101-120000
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+import main
+
+GAMIFY_HOME = Path.home() / ".gamify"
+BACKUP_NAME = re.compile(r'^\d{8}-\d{6}$')
+
+# Скільки сторінок SQLite копіювати за крок і скільки чекати між кроками
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+# Після стількох перезапусків покрокової копії (запис з іншого з'єднання) копіюємо за один прохід
+MAX_RESTARTS = 3
+CHUNK = 1 << 20
+
+class TooManyRestarts(Exception):
+    pass
+
+def backup_sqlite(target, pages=PAGES_PER_STEP):
+    """Онлайн-копія SQLite порціями по pages сторінок: між кроками база вільна для записів застосунку"""
+    snapshot = target.with_name(target.name + '.tmp')
+    src = sqlite3.connect(str(main.DB_PATH))
+    dst = sqlite3.connect(str(snapshot))
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        # Запис з іншого з'єднання змушує SQLite почати копію спочатку - remaining знову росте
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise TooManyRestarts()
+        state['remaining'] = remaining
+        time.sleep(STEP_PAUSE)
+
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+        except TooManyRestarts:
+            # Один прохід тримає лише знімок читання - у WAL-режимі записи застосунку йдуть паралельно
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+    with open(snapshot, 'rb') as f, gzip.open(target, 'wb') as out:
+        shutil.copyfileobj(f, out, CHUNK)
+    snapshot.unlink()
+
+def ordered_tables(c):
+    """Таблиці схеми public так, щоб ті, на які посилаються, йшли першими"""
+    c.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_type='BASE TABLE' ORDER BY table_name")
+    tables = [row[0] for row in c.fetchall()]
+    c.execute("SELECT conrelid::regclass::text, confrelid::regclass::text FROM pg_constraint WHERE contype='f'")
+    depends = {}
+    for table, parent in c.fetchall():
+        depends.setdefault(table, set()).add(parent)
+
+    ordered = []
+    def visit(table):
+        if table not in ordered:
+            for parent in sorted(depends.get(table, ())):
+                if parent != table and parent in tables:
+                    visit(parent)
+            ordered.append(table)
+    for table in tables:
+        visit(table)
+    return ordered
+
+def dump_postgres(conn, target):
+    """Логічний дамп усіх таблиць одним знімком: COPY TO STDOUT потоком у gzip, без проміжних файлів.
+    Результат - SQL для psql, що замінює дані у вже створеній застосунком схемі"""
+    # REPEATABLE READ дає узгоджений знімок, а читання не блокує записи застосунку
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    c = conn.cursor()
+    tables = ordered_tables(c)
+
+    with gzip.open(target, 'wt', encoding='utf-8') as out:
+        out.write(f"-- Life Gamification, {datetime.now():%Y-%m-%d %H:%M:%S}\nBEGIN;\n")
+        out.write(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY;\n")
+        for table in tables:
+            c.execute("""SELECT column_name, column_default FROM information_schema.columns
+                         WHERE table_schema='public' AND table_name=%s ORDER BY ordinal_position""", (table,))
+            columns = c.fetchall()
+            names = ', '.join(name for name, _ in columns)
+            out.write(f"COPY {table} ({names}) FROM stdin;\n")
+            c.copy_expert(f"COPY {table} ({names}) TO STDOUT", out)
+            out.write("\\.\n")
+            for name, default in columns:
+                if default and default.startswith('nextval('):
+                    out.write(f"SELECT setval(pg_get_serial_sequence('{table}', '{name}'), "
+                              f"COALESCE((SELECT MAX({name}) FROM {table}), 0) + 1, false);\n")
+        out.write("COMMIT;\n")
+    conn.rollback()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def asset_files():
+    """Файли поза БД: картинки і Parquet-архіви задач (compact.py)"""
+    files = [main.NIKOCOIN_PATH] if main.NIKOCOIN_PATH.exists() else []
+    if main.IMAGES_PATH.exists():
+        files += sorted(path for path in main.IMAGES_PATH.iterdir() if path.is_file())
+    if main.ARCHIVE_PATH.exists():
+        files += sorted(main.ARCHIVE_PATH.glob('*.parquet'))
+    return files
+
+def backup_images(dest, previous):
+    """Інкрементальна копія картинок і архівів задач: файли зберігаються один раз за sha256, копія містить лише маніфест.
+    Хеш перераховується тільки для файлів, у яких змінився розмір або mtime"""
+    blobs = dest / 'images'
+    blobs.mkdir(parents=True, exist_ok=True)
+    manifest, copied = {}, 0
+    for path in asset_files():
+        rel = path.relative_to(GAMIFY_HOME).as_posix()
+        stat = path.stat()
+        entry = previous.get(rel)
+        if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = {'sha256': file_sha256(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+        blob = blobs / entry['sha256']
+        if not blob.exists():
+            tmp = blob.with_name(blob.name + '.tmp')
+            shutil.copyfile(path, tmp)
+            tmp.replace(blob)
+            copied += 1
+        manifest[rel] = entry
+    return manifest, copied
+
+def list_backups(dest):
+    """Завершені копії від найстарішої до найновішої"""
+    if not dest.exists():
+        return []
+    return sorted(path for path in dest.iterdir() if path.is_dir() and BACKUP_NAME.match(path.name))
+
+def read_manifest(backup):
+    with open(backup / 'manifest.json', encoding='utf-8') as f:
+        return json.load(f)
+
+def create_backup(dest=main.BACKUP_PATH, keep=main.BACKUP_KEEP, pg_url=None, pages=PAGES_PER_STEP):
+    """Нова копія: база + маніфест картинок; потім ротація. Повертає шлях до копії"""
+    dest.mkdir(parents=True, exist_ok=True)
+    backups = list_backups(dest)
+    previous = read_manifest(backups[-1])['images'] if backups else {}
+
+    name = datetime.now().strftime('%Y%m%d-%H%M%S')
+    partial = dest / f"{name}.partial"
+    partial.mkdir()
+
+    if pg_url or main.IS_CLOUD:
+        import psycopg2
+        conn = psycopg2.connect(pg_url) if pg_url else main.get_connection()
+        try:
+            database = 'postgres.sql.gz'
+            dump_postgres(conn, partial / database)
+        finally:
+            conn.close()
+        backend = 'postgres'
+    else:
+        database = 'xp.db.gz'
+        backup_sqlite(partial / database, pages)
+        backend = 'sqlite'
+
+    images, copied = backup_images(dest, previous)
+    with open(partial / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'backend': backend,
+                   'database': database, 'images': images}, f, ensure_ascii=False, indent=1)
+
+    # Копія з'являється під справжнім ім'ям лише повністю записаною
+    backup = dest / name
+    partial.rename(backup)
+    rotate(dest, keep)
+    print(f"Копия {backup} ({backend}), картинок: {len(images)}, новых: {copied}")
+    return backup
+
+def rotate(dest, keep):
+    """Лишає keep останніх копій і прибирає картинки, на які вони більше не посилаються"""
+    for old in list_backups(dest)[:-keep] if keep > 0 else []:
+        shutil.rmtree(old)
+    for partial in dest.glob('*.partial'):
+        if partial.stat().st_mtime < time.time() - 24 * 3600:
+            shutil.rmtree(partial)
+
+    referenced = set()
+    for backup in list_backups(dest):
+        referenced.update(entry['sha256'] for entry in read_manifest(backup)['images'].values())
+    blobs = dest / 'images'
+    if blobs.exists():
+        for blob in blobs.iterdir():
+            if blob.name not in referenced and not blob.name.endswith('.tmp'):
+                blob.unlink()
+
+def restore_backup(name, dest=main.BACKUP_PATH):
+    """Повертає картинки й SQLite-базу з копії (застосунок має бути зупинений)"""
+    backup = dest / name
+    manifest = read_manifest(backup)
+
+    for rel, entry in manifest['images'].items():
+        path = GAMIFY_HOME / rel
+        if path.exists() and file_sha256(path) == entry['sha256']:
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(dest / 'images' / entry['sha256'], path)
+
+    source = backup / manifest['database']
+    if manifest['backend'] == 'postgres':
+        print(f"Картинки восстановлены. Данные: gunzip -c {source} | psql <url>")
+        return
+
+    tmp = main.DB_PATH.with_name(main.DB_PATH.name + '.restore')
+    with gzip.open(source, 'rb') as f, open(tmp, 'wb') as out:
+        shutil.copyfileobj(f, out, CHUNK)
+    if main.DB_PATH.exists():
+        main.DB_PATH.replace(main.DB_PATH.with_name(main.DB_PATH.name + '.before-restore'))
+    # WAL попередньої бази не можна застосовувати до відновленої
+    for suffix in ('-wal', '-shm'):
+        stale = main.DB_PATH.with_name(main.DB_PATH.name + suffix)
+        if stale.exists():
+            stale.replace(main.DB_PATH.with_name(main.DB_PATH.name + '.before-restore' + suffix))
+    tmp.replace(main.DB_PATH)
+    print(f"Восстановлено из {backup}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Резервные копии Life Gamification")
+    parser.add_argument('--dest', type=Path, default=main.BACKUP_PATH, help="каталог с копиями")
+    parser.add_argument('--keep', type=int, default=main.BACKUP_KEEP, help="сколько последних копий хранить")
+    parser.add_argument('--pages', type=int, default=PAGES_PER_STEP, help="страниц SQLite за один шаг")
+    parser.add_argument('--pg-url', help="строка подключения PostgreSQL (по умолчанию - из secrets)")
+    parser.add_argument('--list', action='store_true', help="показать копии")
+    parser.add_argument('--restore', metavar='NAME', help="восстановить копию")
+    args = parser.parse_args()
+
+    if args.list:
+        for backup in list_backups(args.dest):
+            manifest = read_manifest(backup)
+            print(backup.name, manifest['backend'], f"картинок: {len(manifest['images'])}")
+    elif args.restore:
+        restore_backup(args.restore, args.dest)
+    else:
+        create_backup(args.dest, args.keep, args.pg_url, args.pages)
@@ -0,0 +1,280 @@
+"""
+Life Gamification - компактизація старих задач
+Запуск: python compact.py [--months N] [--dry-run]
+        python compact.py --list
+        python compact.py --restore ID
+Задачі, старші за N місяців, переїжджають у Parquet-архів (~/.gamify/archive), а в БД лишаються
+підсумки за день і тип задачі (task_rollups). XP, рівні, баланс і статистика не змінюються.
+PostgreSQL: як і застосунок - STREAMLIT_SHARING_MODE + secrets або GAMIFY_PG_URL.
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import main
+from backup import file_sha256
+
+CHUNK = 50000
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('date', pa.string()),
+    ('front_code', pa.string()),
+    ('tier', pa.string()),
+    ('piece_type', pa.string()),
+    ('note', pa.string()),
+    ('minutes', pa.int64()),
+    ('difficulty', pa.int64()),
+    ('status', pa.string()),
+    ('total_xp', pa.float64()),
+    ('coins_earned', pa.float64()),
+])
+COLUMNS = SCHEMA.names
+TEXT_COLUMNS = [field.name for field in SCHEMA if field.type == pa.string()]
+
+def cutoff_date(months, today=None):
+    """Перший день місяця months місяців тому: усе, що раніше, йде в архів"""
+    today = today or date.today()
+    month = today.year * 12 + today.month - 1 - months
+    return date(month // 12, month % 12 + 1, 1).strftime('%Y-%m-%d')
+
+def begin_read(conn):
+    """Узгоджений знімок лише для читання (з'єднання без відкритої транзакції): записи застосунку не чекають"""
+    if main.IS_CLOUD:
+        conn.cursor().execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    else:
+        # У WAL відкладена транзакція читає один знімок від першого SELECT до кінця
+        conn.execute("BEGIN")
+
+def begin(conn):
+    """Транзакція (з'єднання має бути без відкритої), в якій знімки до і після узгоджені між собою"""
+    if main.IS_CLOUD:
+        # Паралельна зміна тих самих рядків застосунком обірве компактизацію, а не зіпсує підсумки
+        conn.cursor().execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    else:
+        conn.execute("BEGIN IMMEDIATE")
+
+def tenths(column):
+    """XP і монети задачі округлені до 0.1: у десятих суми порівнюються точно, без допусків"""
+    if main.IS_CLOUD:
+        return f"CAST(ROUND(CAST({column} AS DOUBLE PRECISION) * 10) AS BIGINT)"
+    return f"CAST(ROUND({column} * 10) AS INTEGER)"
+
+def snapshot(conn):
+    """Те, що компактизація не має змінити: загальний рівень, по кожному фронту - кількість задач,
+    хвилини, XP і монети (у десятих) і рівень"""
+    c = conn.cursor()
+    c.execute(f"""SELECT front_code, SUM(task_count), COALESCE(SUM(minutes), 0),
+                         SUM({tenths('total_xp')}), SUM({tenths('coins_earned')})
+                  FROM task_totals GROUP BY front_code""")
+    fronts = {row[0]: tuple(int(value) for value in row[1:]) + (main.get_level(int(row[3]) / 10, conn),)
+              for row in c.fetchall()}
+    return {'level': main.get_level(main.get_overall_xp(conn), conn), 'fronts': fronts}
+
+def compare(before, after):
+    """Список розбіжностей між двома знімками"""
+    problems = [('level', before['level'], after['level'])] if before['level'] != after['level'] else []
+    for front in sorted(set(before['fronts']) | set(after['fronts'])):
+        old, new = before['fronts'].get(front), after['fronts'].get(front)
+        if old != new:
+            problems.append((front, old, new))
+    return problems
+
+def task_checksums(conn, cutoff, max_id):
+    """Контрольні суми задач, що йдуть в архів: кількість, суми id, хвилин, складності,
+    XP і монет у десятих, довжин текстових полів"""
+    ph = '%s' if main.IS_CLOUD else '?'
+    lengths = ' + '.join(f"COALESCE(LENGTH({column}), 0)" for column in TEXT_COLUMNS)
+    c = conn.cursor()
+    c.execute(f"""SELECT COUNT(*), COALESCE(SUM(id), 0), COALESCE(SUM(minutes), 0), COALESCE(SUM(difficulty), 0),
+                         COALESCE(SUM({tenths('total_xp')}), 0), COALESCE(SUM({tenths('coins_earned')}), 0),
+                         COALESCE(SUM({lengths}), 0)
+                  FROM tasks WHERE date < {ph} AND id <= {ph}""", (cutoff, max_id))
+    return tuple(int(value) for value in c.fetchone())
+
+def file_checksums(path):
+    """Ті самі контрольні суми, прочитані з файлу архіву"""
+    sums = [0] * 7
+    for batch in pq.ParquetFile(str(path)).iter_batches(batch_size=CHUNK):
+        data = batch.to_pydict()
+        sums[0] += batch.num_rows
+        for i, column in enumerate(('id', 'minutes', 'difficulty'), 1):
+            sums[i] += sum(value or 0 for value in data[column])
+        for i, column in enumerate(('total_xp', 'coins_earned'), 4):
+            sums[i] += sum(round((value or 0) * 10) for value in data[column])
+        sums[6] += sum(len(value or '') for column in TEXT_COLUMNS for value in data[column])
+    return tuple(sums)
+
+def fsync(path):
+    """Скидає файл (або запис каталогу після перейменування) на диск"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_archive(conn, path, cutoff, max_id):
+    """Сирі задачі до cutoff порціями по id у Parquet (zstd), файл скинутий на диск. Повертає кількість рядків"""
+    ph = '%s' if main.IS_CLOUD else '?'
+    c = conn.cursor()
+    rows, last_id = 0, 0
+    with pq.ParquetWriter(str(path), SCHEMA, compression='zstd') as writer:
+        while True:
+            c.execute(f"""SELECT {', '.join(COLUMNS)} FROM tasks
+                          WHERE date < {ph} AND id <= {ph} AND id > {ph} ORDER BY id LIMIT {ph}""",
+                      (cutoff, max_id, last_id, CHUNK))
+            batch = c.fetchall()
+            if not batch:
+                break
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, SCHEMA)], schema=SCHEMA))
+            rows += len(batch)
+            last_id = batch[-1][0]
+    fsync(path)
+    return rows
+
+def compact(conn, months=main.TASK_RETENTION_MONTHS, dest=main.ARCHIVE_PATH, dry_run=False):
+    """Архівує задачі, старші за months місяців, і замінює їх підсумками. Повертає id архіву або None.
+    Архів пишеться зі знімка для читання; блокування запису береться лише на перевірку, підсумки і видалення"""
+    ph = '%s' if main.IS_CLOUD else '?'
+    cutoff = cutoff_date(months)
+    begin_read(conn)
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(*), MIN(date), MAX(id) FROM tasks WHERE date < {ph}", (cutoff,))
+    count, date_from, max_id = c.fetchone()
+    if not count:
+        conn.rollback()
+        print(f"Нет задач старше {cutoff}")
+        return None
+    if dry_run:
+        conn.rollback()
+        print(f"В архив уйдёт задач: {count} ({date_from} - {cutoff})")
+        return None
+
+    dest.mkdir(parents=True, exist_ok=True)
+    name = f"tasks-{date_from}-{cutoff}-{datetime.now():%Y%m%d-%H%M%S}.parquet"
+    partial = dest / (name + '.partial')
+    try:
+        try:
+            rows = write_archive(conn, partial, cutoff, max_id)
+        finally:
+            conn.rollback()
+        checksums = file_checksums(partial)
+        if rows != count or checksums[0] != count:
+            raise RuntimeError(f"Архив {partial} не совпадает с базой")
+        sha256 = file_sha256(partial)
+
+        begin(conn)
+        # Поки писався файл, застосунок міг видалити стару задачу: архів тоді вже не та сама історія
+        if task_checksums(conn, cutoff, max_id) != checksums:
+            raise RuntimeError("Задачи изменились, пока писался архив - ничего не изменено")
+        before = snapshot(conn)
+        c.execute(f"""INSERT INTO task_archives (created_at, file, date_from, date_to, rows, sha256)
+                      VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph})""" + (" RETURNING id" if main.IS_CLOUD else ""),
+                  (datetime.now().isoformat(timespec='seconds'), name, date_from, cutoff, count, sha256))
+        archive_id = c.fetchone()[0] if main.IS_CLOUD else c.lastrowid
+        # Суми - у тих самих типах, що й task_totals
+        xp_sum = "SUM(CAST(total_xp AS DOUBLE PRECISION))" if main.IS_CLOUD else "SUM(total_xp)"
+        coins_sum = "SUM(CAST(coins_earned AS DOUBLE PRECISION))" if main.IS_CLOUD else "SUM(coins_earned)"
+        c.execute(f"""
+            INSERT INTO task_rollups (archive_id, date, front_code, tier, piece_type, status,
+                                      task_count, minutes, total_xp, coins_earned)
+            SELECT {ph}, date, front_code, tier, piece_type, status,
+                   COUNT(*), COALESCE(SUM(minutes), 0), COALESCE({xp_sum}, 0), COALESCE({coins_sum}, 0)
+            FROM tasks
+            WHERE date < {ph} AND id <= {ph}
+            GROUP BY date, front_code, tier, piece_type, status
+        """, (archive_id, cutoff, max_id))
+        c.execute(f"DELETE FROM tasks WHERE date < {ph} AND id <= {ph}", (cutoff, max_id))
+        if c.rowcount != count:
+            raise RuntimeError(f"Удалено {c.rowcount} задач вместо {count}")
+
+        problems = compare(before, snapshot(conn))
+        if problems:
+            for key, old, new in problems:
+                print(f"Расхождение {key}: было {old}, стало {new}")
+            raise RuntimeError("Итоги после компактизации не совпадают - ничего не изменено")
+
+        main.bump_data_version(conn)
+        partial.rename(dest / name)
+        fsync(dest)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        partial.unlink(missing_ok=True)
+        raise
+
+    print(f"Архив {archive_id}: {dest / name}, задач: {count} ({date_from} - {cutoff}), итоги совпадают")
+    return archive_id
+
+def restore(conn, archive_id, dest=main.ARCHIVE_PATH):
+    """Повертає задачі архіву в tasks замість його підсумків (задачі видалених фронтів не повертаються)"""
+    ph = '%s' if main.IS_CLOUD else '?'
+    begin(conn)
+    c = conn.cursor()
+    c.execute(f"SELECT file, rows, sha256 FROM task_archives WHERE id = {ph}", (archive_id,))
+    row = c.fetchone()
+    if not row:
+        conn.rollback()
+        sys.exit(f"Нет архива {archive_id}")
+    name, count, sha256 = row
+    path = dest / name
+    if not path.exists() or file_sha256(path) != sha256:
+        conn.rollback()
+        sys.exit(f"Файл архива {path} отсутствует или повреждён")
+
+    try:
+        before = snapshot(conn)
+        c.execute(f"SELECT DISTINCT front_code FROM task_rollups WHERE archive_id = {ph}", (archive_id,))
+        fronts = {row[0] for row in c.fetchall()}
+        restored = 0
+        for batch in pq.ParquetFile(str(path)).iter_batches(batch_size=CHUNK):
+            rows = [tuple(task[col] for col in COLUMNS) for task in batch.to_pylist() if task['front_code'] in fronts]
+            c.executemany(f"INSERT INTO tasks ({', '.join(COLUMNS)}) VALUES ({', '.join([ph] * len(COLUMNS))})", rows)
+            restored += len(rows)
+        c.execute(f"DELETE FROM task_rollups WHERE archive_id = {ph}", (archive_id,))
+        c.execute(f"DELETE FROM task_archives WHERE id = {ph}", (archive_id,))
+
+        problems = compare(before, snapshot(conn))
+        if problems:
+            for key, old, new in problems:
+                print(f"Расхождение {key}: было {old}, стало {new}")
+            raise RuntimeError("Итоги после восстановления не совпадают - ничего не изменено")
+        main.bump_data_version(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    path.unlink()
+    print(f"Восстановлено задач: {restored} из {count}")
+    return restored
+
+def list_archives(conn):
+    c = conn.cursor()
+    c.execute("SELECT id, date_from, date_to, rows, file FROM task_archives ORDER BY id")
+    return c.fetchall()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Компактизация старых задач Life Gamification")
+    parser.add_argument('--months', type=int, default=main.TASK_RETENTION_MONTHS,
+                        help="сколько месяцев задач хранить целиком")
+    parser.add_argument('--dry-run', action='store_true', help="только посчитать, что уйдёт в архив")
+    parser.add_argument('--list', action='store_true', help="показать архивы")
+    parser.add_argument('--restore', type=int, metavar='ID', help="вернуть задачи архива в базу")
+    args = parser.parse_args()
+
+    conn = main.init_database()
+    if args.list:
+        for archive_id, date_from, date_to, rows, name in list_archives(conn):
+            print(archive_id, f"{date_from} - {date_to}", f"задач: {rows}", name)
+    elif args.restore:
+        restore(conn, args.restore)
+    else:
+        compact(conn, args.months, dry_run=args.dry_run)
+    conn.close()
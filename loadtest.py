@@ -0,0 +1,158 @@
+"""
+Life Gamification - навантажувальний тест: багато одночасних сесій справжнього main.py
+Запуск: python loadtest.py [--sessions 20] [--actions 30] [--backend sqlite|pg --pg-url URL]
+Усі сесії працюють з однією базою в HOME (--home), журнал офлайн-записів у кожної свій.
+PostgreSQL-прогін пише в базу - вказуйте тестову, а не робочу.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT = str(Path(__file__).with_name('main.py'))
+LOCK_ERRORS = ('database is locked', 'deadlock detected', 'could not obtain lock', 'lock timeout')
+# Початок попереджень застосунку про те, що БД недоступна і дія лише збережена в журналі
+OFFLINE_NOTICE = "Нет связи с базой"
+# Скільки чекати, поки всі процеси-сесії імпортують Streamlit і стануть на старт
+START_TIMEOUT = 300
+
+def percentile(values, p):
+    """Перцентиль методом найближчого рангу"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+def build_report(all_runs, wall):
+    """Зведення по діях: перцентилі латентності прогону, частка помилок і блокувань"""
+    rows = []
+    for action in sorted({run[0] for run in all_runs}) + ['ВСЕГО']:
+        runs = [run for run in all_runs if action == 'ВСЕГО' or run[0] == action]
+        latencies = [seconds for _, seconds, _ in runs]
+        errors = [error for _, _, error in runs if error]
+        rows.append({
+            'action': action, 'runs': len(runs),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'errors': len(errors),
+            'lock_errors': sum(1 for error in errors if any(lock in error.lower() for lock in LOCK_ERRORS)),
+            'error_rate': len(errors) / len(runs) if runs else 0,
+        })
+    return {'wall_s': wall, 'throughput_rps': len(all_runs) / wall if wall else 0, 'actions': rows}
+
+def run_session(session_id, args, start, results):
+    """Одна віртуальна сесія у власному процесі: AppTest не розрахований на паралельні прогони в одному.
+    Відкриває застосунок, виконує випадкові дії і віддає [(дія, секунди, помилка)] у results"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(args.seed + session_id)
+    # Процеси-сесії - як окремі сервери застосунку: спільний журнал вони б переписували один одному
+    os.environ['GAMIFY_JOURNAL'] = str(Path(os.environ['HOME']) / ".gamify" / f"journal-{session_id}.jsonl")
+    at = AppTest.from_file(SCRIPT, default_timeout=args.timeout)
+    if args.backend == 'pg':
+        at.secrets['connections'] = {'postgresql': {'url': args.pg_url}}
+    runs = []
+
+    def measure(action, step):
+        begin = time.perf_counter()
+        try:
+            step()
+            # Помилку БД застосунок може показати попередженням, а не винятком - дія все одно не дійшла до бази
+            error = ('; '.join(str(e.value) for e in at.exception) or
+                     '; '.join(n.value for n in list(at.warning) + list(at.info) if OFFLINE_NOTICE in n.value) or None)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        runs.append((action, time.perf_counter() - begin, error))
+        return error is None
+
+    try:
+        start.wait(START_TIMEOUT)
+        if measure('open', at.run):
+            for _ in range(args.actions):
+                if args.think:
+                    time.sleep(rng.uniform(0, args.think))
+                play(at, rng, measure)
+    finally:
+        results.put(runs)
+
+def play(at, rng, measure):
+    """Випадкова дія користувача: перехід на фронт, логування, магазин, покупка або дашборд"""
+    action = rng.choices(['front', 'log', 'shop', 'buy', 'dashboard'], weights=[2, 4, 1, 1, 1])[0]
+    sidebar = {button.label: button for button in at.sidebar.button}
+    fronts = [button for button in at.sidebar.button if button.key and button.key.startswith('nav_')]
+
+    if action == 'front' or (action == 'log' and at.session_state['active_page'] != 'front'):
+        if fronts:
+            measure('front', rng.choice(fronts).click().run)
+    elif action == 'log':
+        buttons = [button for button in at.button if button.key and button.key.startswith('do_')]
+        if buttons:
+            measure('log', rng.choice(buttons).click().run)
+    elif action in ('shop', 'buy'):
+        if at.session_state['active_page'] != 'shop':
+            measure('shop', sidebar["🛒 Магазин"].click().run)
+        buttons = [button for button in at.button if button.key and button.key.startswith('buy_') and not button.disabled]
+        if action == 'buy' and buttons:
+            measure('buy', rng.choice(buttons).click().run)
+    else:
+        measure('dashboard', sidebar["🏠 Дашборд"].click().run)
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Life Gamification")
+    parser.add_argument('--sessions', type=int, default=20, help="одновременных сессий")
+    parser.add_argument('--actions', type=int, default=30, help="действий на сессию")
+    parser.add_argument('--think', type=float, default=0.0, help="пауза между действиями, до N секунд")
+    parser.add_argument('--backend', choices=['sqlite', 'pg'], default='sqlite')
+    parser.add_argument('--pg-url', help="тестовая база PostgreSQL для --backend pg")
+    parser.add_argument('--home', help="каталог с .gamify (по умолчанию - временный)")
+    parser.add_argument('--timeout', type=float, default=120, help="таймаут одного прогона, с")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="отчёт в JSON")
+    args = parser.parse_args()
+
+    # Застосунок читає оточення під час кожного прогону скрипта - налаштовуємо до першої сесії
+    os.environ['HOME'] = args.home or tempfile.mkdtemp(prefix='gamify-load-')
+    Path(os.environ['HOME']).mkdir(parents=True, exist_ok=True)
+    if args.backend == 'pg':
+        if not args.pg_url:
+            parser.error("--backend pg требует --pg-url")
+        os.environ['STREAMLIT_SHARING_MODE'] = 'loadtest'
+
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Barrier(args.sessions + 1)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=run_session, args=(i, args, start, results), daemon=True)
+               for i in range(args.sessions)]
+    for worker in workers:
+        worker.start()
+    # Імпорт Streamlit і прогрів процесів не входять у виміряний час
+    start.wait(START_TIMEOUT)
+    began = time.perf_counter()
+    all_runs = [run for _ in workers for run in results.get()]
+    for worker in workers:
+        worker.join()
+    report = build_report(all_runs, time.perf_counter() - began)
+    report.update({'backend': args.backend, 'sessions': args.sessions})
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+        return
+
+    print(f"{args.backend}: {args.sessions} сессий, {report['wall_s']:.1f} с, {report['throughput_rps']:.1f} прогонов/с")
+    print(f"{'действие':<10}{'прогонов':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'ошибок':>8}{'блокир.':>8}{'доля':>7}")
+    for row in report['actions']:
+        print(f"{row['action']:<10}{row['runs']:>9}{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['p99_ms']:>9.0f}"
+              f"{row['errors']:>8}{row['lock_errors']:>8}{row['error_rate']:>7.1%}")
+    errors = sorted({error for _, _, error in all_runs if error})
+    for error in errors[:5]:
+        print("  !", error[:200])
+
+if __name__ == "__main__":
+    sys.exit(main())
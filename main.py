@@ -8,8 +8,20 @@ import pandas as pd
 from datetime import datetime, timedelta
 from pathlib import Path
 import plotly.express as px
+from PIL import Image
 import base64
+import io
+import json
+import logging
+from collections import OrderedDict
 import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
 
 # Визначаємо чи запущено на Streamlit Cloud
 IS_CLOUD = os.environ.get('STREAMLIT_SHARING_MODE') is not None or 'streamlit.app' in os.environ.get('HOSTNAME', '')
@@ -17,27 +29,77 @@ IS_CLOUD = os.environ.get('STREAMLIT_SHARING_MODE') is not None or 'streamlit.ap
 # ============= DATABASE CONNECTION =============
 if IS_CLOUD:
     import psycopg2
+    import psycopg2.errors
     from psycopg2.extras import RealDictCursor
 
-    def get_connection():
-        """PostgreSQL connection для Streamlit Cloud"""
-        conn_str = st.secrets["connections"]["postgresql"]["url"]
-        return psycopg2.connect(conn_str)
-else:
-    import sqlite3
+    def get_database_url():
+        """Рядок підключення: GAMIFY_PG_URL (для API та інструментів) або secrets Streamlit"""
+        return os.environ.get('GAMIFY_PG_URL') or st.secrets["connections"]["postgresql"]["url"]
 
+    def get_connection(statement_timeout=None):
+        """PostgreSQL connection для Streamlit Cloud; statement_timeout (мс) обмежує кожен запит"""
+        options = f"-c statement_timeout={statement_timeout}" if statement_timeout else None
+        return psycopg2.connect(get_database_url(), connect_timeout=DB_CONNECT_TIMEOUT, options=options)
+else:
     DB_PATH = Path.home() / ".gamify" / "xp.db"
     DB_PATH.parent.mkdir(exist_ok=True)
 
-    def get_connection():
-        """SQLite connection для локальної розробки"""
-        return sqlite3.connect(str(DB_PATH), check_same_thread=False)
+    def get_connection(statement_timeout=None):
+        """SQLite connection для локальної розробки; statement_timeout (мс) - скільки чекати на блокування"""
+        timeout = statement_timeout / 1000 if statement_timeout else 5.0
+        return sqlite3.connect(str(DB_PATH), check_same_thread=False, timeout=timeout)
 
 # ============= CONFIG =============
 IMAGES_PATH = Path.home() / ".gamify" / "shop_images"
 NIKOCOIN_PATH = Path.home() / ".gamify" / "nikocoin.png"
 IMAGES_PATH.mkdir(exist_ok=True, parents=True)
 
+# Скільки точок максимум отримує Plotly на один графік динаміки
+TIMELINE_POINTS = 200
+TIMELINE_GRANULARITY = {'День': 'day', 'Неделя': 'week', 'Месяц': 'month'}
+
+# Локальне SQLite-дзеркало PostgreSQL для читання (GAMIFY_READ_MIRROR=1)
+READ_MIRROR = IS_CLOUD and os.environ.get('GAMIFY_READ_MIRROR') == '1'
+# Як часто дзеркало повністю звіряється з PostgreSQL (зміни з інших пристроїв)
+MIRROR_REFRESH_SECONDS = 60
+
+# Кеш рендеру: скільки результатів тримати і як довго довіряти їм без запису з цього процесу
+RENDER_CACHE_SIZE = 256
+RENDER_CACHE_TTL = 300
+
+# Скільки результатів повнотекстового пошуку показувати
+SEARCH_LIMIT = 50
+# Скільки типів задач на сторінці каталогу швидкого логування
+PIECE_TYPE_PAGE = 20
+# Скільки товарів на сторінці магазину і скільки мініатюр картинок тримати в пам'яті
+SHOP_PAGE = 12
+THUMBNAIL_SIZE = 200
+THUMBNAIL_CACHE = 256
+
+TIERS = ['Daily', 'Weekly', 'Sprint', 'Campaign']
+
+# Ключ advisory-блокування PostgreSQL, під яким процеси застосунку по черзі створюють схему і стартові дані
+SCHEMA_LOCK = 4_735_001
+
+# Резервні копії (backup.py): куди писати і скільки останніх зберігати
+BACKUP_PATH = Path.home() / ".gamify" / "backups"
+BACKUP_KEEP = 7
+
+# Компактизація (compact.py): задачі, старші за стільки місяців, переїжджають у Parquet-архів
+TASK_RETENTION_MONTHS = 12
+ARCHIVE_PATH = Path.home() / ".gamify" / "archive"
+
+# Скільки сторінка чекає на БД: підключення (с) і один запит (мс)
+DB_CONNECT_TIMEOUT = 5
+DB_STATEMENT_TIMEOUT = 10000
+# Записи, які не дійшли до БД, чекають тут і повторюються по черзі, коли зв'язок повернеться.
+# GAMIFY_JOURNAL - свій файл для кожного процесу, що працює з тією самою базою (навантажувальний тест)
+JOURNAL_PATH = Path(os.environ.get('GAMIFY_JOURNAL') or Path.home() / ".gamify" / "journal.jsonl")
+# Скільки після збою не пробувати БД знову: сторінки одразу відкриваються в офлайн-режимі
+OFFLINE_RETRY_SECONDS = 15
+# Скільки днів пам'ятати id застосованих записів
+APPLIED_OPS_KEEP_DAYS = 30
+
 def get_nikocoin_icon():
     """Повертає іконку валюти - або кастомну, або емодзі"""
     if NIKOCOIN_PATH.exists():
@@ -50,193 +112,491 @@ def get_image_base64(image_path):
         return base64.b64encode(f.read()).decode()
 
 # ============= DATABASE INITIALIZATION =============
+# Баланс никоинов з нуля: зароблене + бонуси - витрачене (суми в double - REAL у PostgreSQL 4-байтовий)
+BALANCE_SQL = """(SELECT COALESCE(SUM(CAST(coins_earned AS DOUBLE PRECISION)), 0) FROM task_totals)
+    + (SELECT COALESCE(SUM(CAST(amount AS DOUBLE PRECISION)), 0) FROM coins_log)
+    - (SELECT COALESCE(SUM(coins_spent), 0) FROM purchases)"""
+
 def init_database():
     conn = get_connection()
     c = conn.cursor()
 
     if IS_CLOUD:
-        # PostgreSQL schemas
-        c.execute('''CREATE TABLE IF NOT EXISTS fronts (
-            id SERIAL PRIMARY KEY,
-            code TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            coef REAL NOT NULL DEFAULT 1.0,
-            weight REAL NOT NULL DEFAULT 1.0,
-            tier_daily REAL DEFAULT 1.0,
-            tier_weekly REAL DEFAULT 1.2,
-            tier_sprint REAL DEFAULT 1.5,
-            tier_campaign REAL DEFAULT 2.0,
-            diff_1 REAL DEFAULT 0.5,
-            diff_2 REAL DEFAULT 1.0,
-            diff_3 REAL DEFAULT 1.5,
-            diff_4 REAL DEFAULT 2.0,
-            diff_5 REAL DEFAULT 3.0
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-            id SERIAL PRIMARY KEY,
-            date TEXT NOT NULL,
-            front_code TEXT NOT NULL,
-            tier TEXT NOT NULL,
-            piece_type TEXT NOT NULL,
-            note TEXT,
-            minutes INTEGER DEFAULT 0,
-            difficulty INTEGER DEFAULT 2,
-            status TEXT NOT NULL,
-            total_xp REAL DEFAULT 0,
-            coins_earned REAL DEFAULT 0
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS level_thresholds (
-            level INTEGER PRIMARY KEY,
-            xp_threshold INTEGER NOT NULL
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS piece_types (
-            id SERIAL PRIMARY KEY,
-            front_code TEXT NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            tier TEXT NOT NULL,
-            base_xp REAL NOT NULL
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS rewards (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            cost_coins INTEGER NOT NULL,
-            image_path TEXT
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS purchases (
-            id SERIAL PRIMARY KEY,
-            date TEXT NOT NULL,
-            reward_id INTEGER NOT NULL,
-            coins_spent INTEGER NOT NULL,
-            FOREIGN KEY(reward_id) REFERENCES rewards(id)
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS user_prefs (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS coins_log (
-            id SERIAL PRIMARY KEY,
-            date TEXT NOT NULL,
-            source TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT
-        )''')
+        init_postgres_schema(conn)
     else:
-        # SQLite schemas (з оригінального коду)
-        c.execute('''CREATE TABLE IF NOT EXISTS fronts (
-            id INTEGER PRIMARY KEY,
-            code TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            coef REAL NOT NULL DEFAULT 1.0,
-            weight REAL NOT NULL DEFAULT 1.0,
-            tier_daily REAL DEFAULT 1.0,
-            tier_weekly REAL DEFAULT 1.2,
-            tier_sprint REAL DEFAULT 1.5,
-            tier_campaign REAL DEFAULT 2.0,
-            diff_1 REAL DEFAULT 0.5,
-            diff_2 REAL DEFAULT 1.0,
-            diff_3 REAL DEFAULT 1.5,
-            diff_4 REAL DEFAULT 2.0,
-            diff_5 REAL DEFAULT 3.0
-        )''')
-
-        # Міграція для SQLite
-        try:
-            c.execute("SELECT tier_daily FROM fronts LIMIT 1")
-        except:
-            for col in ['tier_daily', 'tier_weekly', 'tier_sprint', 'tier_campaign',
-                        'diff_1', 'diff_2', 'diff_3', 'diff_4', 'diff_5']:
-                try:
-                    default_val = {'tier_daily': 1.0, 'tier_weekly': 1.2, 'tier_sprint': 1.5,
-                                  'tier_campaign': 2.0, 'diff_1': 0.5, 'diff_2': 1.0,
-                                  'diff_3': 1.5, 'diff_4': 2.0, 'diff_5': 3.0}[col]
-                    c.execute(f"ALTER TABLE fronts ADD COLUMN {col} REAL DEFAULT {default_val}")
-                except:
-                    pass
-            conn.commit()
-
-        c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY,
-            date TEXT NOT NULL,
-            front_code TEXT NOT NULL,
-            tier TEXT NOT NULL,
-            piece_type TEXT NOT NULL,
-            note TEXT,
-            minutes INTEGER DEFAULT 0,
-            difficulty INTEGER DEFAULT 2,
-            status TEXT NOT NULL,
-            total_xp REAL DEFAULT 0,
-            coins_earned REAL DEFAULT 0
-        )''')
+        # WAL: читачі (в тому числі онлайн-бекап) не блокують записи застосунку
+        c.execute("PRAGMA journal_mode=WAL")
+        c.fetchone()
+        init_sqlite_schema(conn)
 
-        try:
-            c.execute("SELECT coins_earned FROM tasks LIMIT 1")
-        except:
-            c.execute("ALTER TABLE tasks ADD COLUMN coins_earned REAL DEFAULT 0")
-            conn.commit()
-
-        c.execute('''CREATE TABLE IF NOT EXISTS level_thresholds (
-            level INTEGER PRIMARY KEY,
-            xp_threshold INTEGER NOT NULL
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS piece_types (
-            id INTEGER PRIMARY KEY,
-            front_code TEXT NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            tier TEXT NOT NULL,
-            base_xp REAL NOT NULL
-        )''')
+    conn.commit()
+    return conn
 
-        try:
-            c.execute("SELECT tier FROM piece_types LIMIT 1")
-        except:
-            c.execute("ALTER TABLE piece_types ADD COLUMN tier TEXT DEFAULT 'Daily'")
-            conn.commit()
-
-        c.execute('''CREATE TABLE IF NOT EXISTS rewards (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            cost_coins INTEGER NOT NULL,
-            image_path TEXT
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS purchases (
-            id INTEGER PRIMARY KEY,
-            date TEXT NOT NULL,
-            reward_id INTEGER NOT NULL,
-            coins_spent INTEGER NOT NULL,
-            FOREIGN KEY(reward_id) REFERENCES rewards(id)
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS user_prefs (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS coins_log (
-            id INTEGER PRIMARY KEY,
-            date TEXT NOT NULL,
-            source TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT
-        )''')
+def init_postgres_schema(conn):
+    """Створює (або мігрує) PostgreSQL-схему на переданому з'єднанні"""
+    c = conn.cursor()
+    # CREATE TABLE IF NOT EXISTS не захищений від гонки між процесами, що стартують одночасно
+    c.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK,))
+
+    # PostgreSQL schemas
+    c.execute('''CREATE TABLE IF NOT EXISTS fronts (
+        id SERIAL PRIMARY KEY,
+        code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        coef REAL NOT NULL DEFAULT 1.0,
+        weight REAL NOT NULL DEFAULT 1.0,
+        tier_daily REAL DEFAULT 1.0,
+        tier_weekly REAL DEFAULT 1.2,
+        tier_sprint REAL DEFAULT 1.5,
+        tier_campaign REAL DEFAULT 2.0,
+        diff_1 REAL DEFAULT 0.5,
+        diff_2 REAL DEFAULT 1.0,
+        diff_3 REAL DEFAULT 1.5,
+        diff_4 REAL DEFAULT 2.0,
+        diff_5 REAL DEFAULT 3.0
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS tasks (
+        id SERIAL PRIMARY KEY,
+        date TEXT NOT NULL,
+        front_code TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        piece_type TEXT NOT NULL,
+        note TEXT,
+        minutes INTEGER DEFAULT 0,
+        difficulty INTEGER DEFAULT 2,
+        status TEXT NOT NULL,
+        total_xp REAL DEFAULT 0,
+        coins_earned REAL DEFAULT 0
+    )''')
+
+    # Пороги ростуть x1.5 за рівень і з 24-го не влазять в INTEGER
+    c.execute('''CREATE TABLE IF NOT EXISTS level_thresholds (
+        level INTEGER PRIMARY KEY,
+        xp_threshold BIGINT NOT NULL
+    )''')
+    c.execute("""SELECT 1 FROM information_schema.columns
+                 WHERE table_name='level_thresholds' AND column_name='xp_threshold' AND data_type='integer'""")
+    if c.fetchone():
+        c.execute("ALTER TABLE level_thresholds ALTER COLUMN xp_threshold TYPE BIGINT")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS piece_types (
+        id SERIAL PRIMARY KEY,
+        front_code TEXT NOT NULL,
+        code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        base_xp REAL NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS rewards (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        cost_coins INTEGER NOT NULL,
+        image_path TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS purchases (
+        id SERIAL PRIMARY KEY,
+        date TEXT NOT NULL,
+        reward_id INTEGER NOT NULL,
+        coins_spent INTEGER NOT NULL,
+        FOREIGN KEY(reward_id) REFERENCES rewards(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS user_prefs (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS applied_ops (
+        op_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS coins_log (
+        id SERIAL PRIMARY KEY,
+        date TEXT NOT NULL,
+        source TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT
+    )''')
+
+    # Статистика серій і виконання: scope = код фронту або '' для загальної
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_tally (
+        scope TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        status TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, tier, status)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_days (
+        scope TEXT NOT NULL,
+        date TEXT NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, date)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_streaks (
+        scope TEXT PRIMARY KEY,
+        run_start TEXT,
+        run_end TEXT,
+        longest INTEGER NOT NULL DEFAULT 0
+    )''')
+
+    # Компактизація (compact.py): старі задачі переїжджають у Parquet-архів, а в БД лишаються
+    # підсумки за день і тип задачі. Усі агрегати читають task_totals - сирі задачі разом із підсумками
+    c.execute('''CREATE TABLE IF NOT EXISTS task_archives (
+        id SERIAL PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        file TEXT NOT NULL,
+        date_from TEXT NOT NULL,
+        date_to TEXT NOT NULL,
+        rows BIGINT NOT NULL,
+        sha256 TEXT NOT NULL
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS task_rollups (
+        id SERIAL PRIMARY KEY,
+        archive_id INTEGER NOT NULL REFERENCES task_archives(id),
+        date TEXT NOT NULL,
+        front_code TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        piece_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        task_count BIGINT NOT NULL,
+        minutes BIGINT NOT NULL,
+        total_xp DOUBLE PRECISION NOT NULL,
+        coins_earned DOUBLE PRECISION NOT NULL
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_rollups_front_date ON task_rollups (front_code, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_rollups_archive ON task_rollups (archive_id)")
+    # REAL у tasks - 4-байтовий: суми рахуємо в double, як і підсумки
+    c.execute('''CREATE OR REPLACE VIEW task_totals AS
+        SELECT date, front_code, tier, piece_type, status, 1 AS task_count, minutes,
+               CAST(total_xp AS DOUBLE PRECISION) AS total_xp, CAST(coins_earned AS DOUBLE PRECISION) AS coins_earned
+        FROM tasks
+        UNION ALL
+        SELECT date, front_code, tier, piece_type, status, task_count, minutes, total_xp, coins_earned
+        FROM task_rollups''')
+
+    # Баланс, який ведуть самі записи (задачі, бонуси, покупки): покупка перевіряє один рядок, а не три суми.
+    # Заповнюється з історії при першому створенні
+    c.execute('''CREATE TABLE IF NOT EXISTS coin_balance (
+        id INTEGER PRIMARY KEY,
+        coins DOUBLE PRECISION NOT NULL
+    )''')
+    c.execute(f"INSERT INTO coin_balance (id, coins) SELECT 1, {BALANCE_SQL} WHERE NOT EXISTS (SELECT 1 FROM coin_balance)")
+
+    # Лічильник записів з інших процесів (API, компактизація): сторінки по ньому скидають кеш рендеру
+    c.execute('''CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY,
+        version BIGINT NOT NULL
+    )''')
+    c.execute("INSERT INTO data_version (id, version) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM data_version)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_date ON tasks (date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_front_date ON tasks (front_code, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_piece_type ON tasks (piece_type)")
+
+    # Повнотекстовий пошук: tsvector з нотатки та назви типу задачі, GIN-індекс.
+    # Вектор рахує тригер при вставці, видалення прибирає рядок з індексу саме
+    c.execute("SELECT 1 FROM information_schema.columns WHERE table_name='tasks' AND column_name='search_vector'")
+    backfill = c.fetchone() is None
+    c.execute("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_search ON tasks USING GIN (search_vector)")
+    c.execute('''CREATE OR REPLACE FUNCTION tasks_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple', COALESCE(NEW.note, '') || ' ' ||
+            COALESCE((SELECT name FROM piece_types WHERE code = NEW.piece_type), NEW.piece_type));
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql''')
+    c.execute('''CREATE OR REPLACE FUNCTION piece_types_search_rename() RETURNS trigger AS $$
+    BEGIN
+        UPDATE tasks SET search_vector = to_tsvector('simple', COALESCE(note, '') || ' ' || NEW.name)
+        WHERE piece_type = NEW.code;
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql''')
+    c.execute('''DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'tasks_search_vector') THEN
+            CREATE TRIGGER tasks_search_vector BEFORE INSERT ON tasks
+                FOR EACH ROW EXECUTE FUNCTION tasks_search_vector();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'piece_types_search_rename') THEN
+            CREATE TRIGGER piece_types_search_rename AFTER UPDATE OF name ON piece_types
+                FOR EACH ROW EXECUTE FUNCTION piece_types_search_rename();
+        END IF;
+    END $$''')
+    if backfill:
+        c.execute('''UPDATE tasks t SET search_vector = to_tsvector('simple', COALESCE(t.note, '') || ' ' ||
+            COALESCE((SELECT name FROM piece_types WHERE code = t.piece_type), t.piece_type))''')
+
+    # Каталог типів задач: сторінки тиру за XP і пошук за початком слів назви або коду.
+    # Вираз індексу має збігатися з виразом у load_piece_type_page
+    c.execute("CREATE INDEX IF NOT EXISTS idx_piece_types_front_tier ON piece_types (front_code, tier, base_xp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_piece_types_search ON piece_types USING GIN (to_tsvector('simple', name || ' ' || code))")
+
+    # Магазин: фільтр і сортування за ціною, пошук за назвою (вираз - як у load_reward_page)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rewards_cost ON rewards (cost_coins)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rewards_search ON rewards USING GIN (to_tsvector('simple', name))")
 
     conn.commit()
-    return conn
+
+def init_sqlite_schema(conn):
+    """Створює (або мігрує) SQLite-схему на переданому з'єднанні"""
+    c = conn.cursor()
+
+    # SQLite schemas (з оригінального коду)
+    c.execute('''CREATE TABLE IF NOT EXISTS fronts (
+        id INTEGER PRIMARY KEY,
+        code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        coef REAL NOT NULL DEFAULT 1.0,
+        weight REAL NOT NULL DEFAULT 1.0,
+        tier_daily REAL DEFAULT 1.0,
+        tier_weekly REAL DEFAULT 1.2,
+        tier_sprint REAL DEFAULT 1.5,
+        tier_campaign REAL DEFAULT 2.0,
+        diff_1 REAL DEFAULT 0.5,
+        diff_2 REAL DEFAULT 1.0,
+        diff_3 REAL DEFAULT 1.5,
+        diff_4 REAL DEFAULT 2.0,
+        diff_5 REAL DEFAULT 3.0
+    )''')
+
+    # Міграція для SQLite
+    try:
+        c.execute("SELECT tier_daily FROM fronts LIMIT 1")
+    except:
+        for col in ['tier_daily', 'tier_weekly', 'tier_sprint', 'tier_campaign',
+                    'diff_1', 'diff_2', 'diff_3', 'diff_4', 'diff_5']:
+            try:
+                default_val = {'tier_daily': 1.0, 'tier_weekly': 1.2, 'tier_sprint': 1.5,
+                              'tier_campaign': 2.0, 'diff_1': 0.5, 'diff_2': 1.0,
+                              'diff_3': 1.5, 'diff_4': 2.0, 'diff_5': 3.0}[col]
+                c.execute(f"ALTER TABLE fronts ADD COLUMN {col} REAL DEFAULT {default_val}")
+            except:
+                pass
+        conn.commit()
+
+    c.execute('''CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        front_code TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        piece_type TEXT NOT NULL,
+        note TEXT,
+        minutes INTEGER DEFAULT 0,
+        difficulty INTEGER DEFAULT 2,
+        status TEXT NOT NULL,
+        total_xp REAL DEFAULT 0,
+        coins_earned REAL DEFAULT 0
+    )''')
+
+    try:
+        c.execute("SELECT coins_earned FROM tasks LIMIT 1")
+    except:
+        c.execute("ALTER TABLE tasks ADD COLUMN coins_earned REAL DEFAULT 0")
+        conn.commit()
+
+    c.execute('''CREATE TABLE IF NOT EXISTS level_thresholds (
+        level INTEGER PRIMARY KEY,
+        xp_threshold INTEGER NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS piece_types (
+        id INTEGER PRIMARY KEY,
+        front_code TEXT NOT NULL,
+        code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        base_xp REAL NOT NULL
+    )''')
+
+    try:
+        c.execute("SELECT tier FROM piece_types LIMIT 1")
+    except:
+        c.execute("ALTER TABLE piece_types ADD COLUMN tier TEXT DEFAULT 'Daily'")
+        conn.commit()
+
+    c.execute('''CREATE TABLE IF NOT EXISTS rewards (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        cost_coins INTEGER NOT NULL,
+        image_path TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS purchases (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        reward_id INTEGER NOT NULL,
+        coins_spent INTEGER NOT NULL,
+        FOREIGN KEY(reward_id) REFERENCES rewards(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS user_prefs (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS applied_ops (
+        op_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS coins_log (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        source TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT
+    )''')
+
+    # Статистика серій і виконання: scope = код фронту або '' для загальної
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_tally (
+        scope TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        status TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, tier, status)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_days (
+        scope TEXT NOT NULL,
+        date TEXT NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, date)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_streaks (
+        scope TEXT PRIMARY KEY,
+        run_start TEXT,
+        run_end TEXT,
+        longest INTEGER NOT NULL DEFAULT 0
+    )''')
+
+    # Компактизація (compact.py): старі задачі переїжджають у Parquet-архів, а в БД лишаються
+    # підсумки за день і тип задачі. Усі агрегати читають task_totals - сирі задачі разом із підсумками
+    c.execute('''CREATE TABLE IF NOT EXISTS task_archives (
+        id INTEGER PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        file TEXT NOT NULL,
+        date_from TEXT NOT NULL,
+        date_to TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        sha256 TEXT NOT NULL
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS task_rollups (
+        id INTEGER PRIMARY KEY,
+        archive_id INTEGER NOT NULL REFERENCES task_archives(id),
+        date TEXT NOT NULL,
+        front_code TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        piece_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        task_count INTEGER NOT NULL,
+        minutes INTEGER NOT NULL,
+        total_xp REAL NOT NULL,
+        coins_earned REAL NOT NULL
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_rollups_front_date ON task_rollups (front_code, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_rollups_archive ON task_rollups (archive_id)")
+    c.execute('''CREATE VIEW IF NOT EXISTS task_totals AS
+        SELECT date, front_code, tier, piece_type, status, 1 AS task_count, minutes, total_xp, coins_earned
+        FROM tasks
+        UNION ALL
+        SELECT date, front_code, tier, piece_type, status, task_count, minutes, total_xp, coins_earned
+        FROM task_rollups''')
+
+    # Баланс, який ведуть самі записи (задачі, бонуси, покупки): покупка перевіряє один рядок, а не три суми.
+    # Заповнюється з історії при першому створенні
+    c.execute('''CREATE TABLE IF NOT EXISTS coin_balance (
+        id INTEGER PRIMARY KEY,
+        coins REAL NOT NULL
+    )''')
+    c.execute(f"INSERT INTO coin_balance (id, coins) SELECT 1, {BALANCE_SQL} WHERE NOT EXISTS (SELECT 1 FROM coin_balance)")
+
+    # Лічильник записів з інших процесів (API, компактизація): сторінки по ньому скидають кеш рендеру
+    c.execute('''CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    )''')
+    c.execute("INSERT INTO data_version (id, version) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM data_version)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_date ON tasks (date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_front_date ON tasks (front_code, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_piece_type ON tasks (piece_type)")
+
+    # Повнотекстовий пошук: FTS5-індекс (rowid = tasks.id), який тригери ведуть інкрементально
+    c.execute("SELECT 1 FROM sqlite_master WHERE name='tasks_fts'")
+    backfill = c.fetchone() is None
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(note, piece_name, tokenize='unicode61 remove_diacritics 2')")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, note, piece_name)
+        VALUES (new.id, COALESCE(new.note, ''),
+                COALESCE((SELECT name FROM piece_types WHERE code = new.piece_type), new.piece_type));
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        DELETE FROM tasks_fts WHERE rowid = old.id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS piece_types_fts_rename AFTER UPDATE OF name ON piece_types BEGIN
+        UPDATE tasks_fts SET piece_name = new.name
+        WHERE rowid IN (SELECT id FROM tasks WHERE piece_type = new.code);
+    END''')
+    if backfill:
+        c.execute('''INSERT INTO tasks_fts (rowid, note, piece_name)
+                     SELECT t.id, COALESCE(t.note, ''), COALESCE(pt.name, t.piece_type)
+                     FROM tasks t LEFT JOIN piece_types pt ON pt.code = t.piece_type''')
+
+    # Каталог типів задач: сторінки тиру за XP і пошук за початком слів назви або коду (rowid = piece_types.id)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_piece_types_front_tier ON piece_types (front_code, tier, base_xp)")
+    c.execute("SELECT 1 FROM sqlite_master WHERE name='piece_types_fts'")
+    backfill = c.fetchone() is None
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS piece_types_fts USING fts5(name, code, tokenize='unicode61 remove_diacritics 2')")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS piece_types_fts_insert AFTER INSERT ON piece_types BEGIN
+        INSERT INTO piece_types_fts (rowid, name, code) VALUES (new.id, new.name, new.code);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS piece_types_fts_update AFTER UPDATE OF name, code ON piece_types BEGIN
+        UPDATE piece_types_fts SET name = new.name, code = new.code WHERE rowid = new.id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS piece_types_fts_delete AFTER DELETE ON piece_types BEGIN
+        DELETE FROM piece_types_fts WHERE rowid = old.id;
+    END''')
+    if backfill:
+        c.execute("INSERT INTO piece_types_fts (rowid, name, code) SELECT id, name, code FROM piece_types")
+
+    # Магазин: фільтр і сортування за ціною, пошук за назвою (rowid = rewards.id)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rewards_cost ON rewards (cost_coins)")
+    c.execute("SELECT 1 FROM sqlite_master WHERE name='rewards_fts'")
+    backfill = c.fetchone() is None
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS rewards_fts USING fts5(name, tokenize='unicode61 remove_diacritics 2')")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS rewards_fts_insert AFTER INSERT ON rewards BEGIN
+        INSERT INTO rewards_fts (rowid, name) VALUES (new.id, new.name);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS rewards_fts_update AFTER UPDATE OF name ON rewards BEGIN
+        UPDATE rewards_fts SET name = new.name WHERE rowid = new.id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS rewards_fts_delete AFTER DELETE ON rewards BEGIN
+        DELETE FROM rewards_fts WHERE rowid = old.id;
+    END''')
+    if backfill:
+        c.execute("INSERT INTO rewards_fts (rowid, name) SELECT id, name FROM rewards")
+
+    conn.commit()
+
 
 def seed_data(conn):
     c = conn.cursor()
+    # Перевірка і вставка під одним блокуванням - інакше одночасно стартовані процеси засіють базу двічі
+    if IS_CLOUD:
+        c.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK,))
+    else:
+        c.execute("BEGIN IMMEDIATE")
     c.execute("SELECT COUNT(*) FROM fronts")
     if c.fetchone()[0] > 0:
+        conn.rollback()
         return
 
     fronts = [
@@ -368,6 +728,293 @@ def seed_data(conn):
 
     conn.commit()
 
+# ============= READ MIRROR =============
+READ_QUERY = re.compile(r'\s*SELECT\b', re.IGNORECASE)
+# SELECT-и, які мають сенс лише на самому PostgreSQL: блокування рядків і службові функції
+PRIMARY_READ = re.compile(r'\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE)\b|\bpg_\w+\s*\(', re.IGNORECASE)
+WRITE_TARGET = re.compile(r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(\w+)', re.IGNORECASE)
+
+class ReadMirror:
+    """Локальна in-memory SQLite-копія таблиць PostgreSQL, спільна для всіх сесій"""
+
+    # Таблиці, що лише доповнюються: підтягуємо рядки з id понад high-water mark
+    APPEND_TABLES = ('tasks', 'purchases', 'coins_log', 'task_rollups')
+    # Невеликі довідники простіше скопіювати повністю
+    SMALL_TABLES = ('fronts', 'piece_types', 'rewards', 'level_thresholds', 'user_prefs', 'task_archives', 'coin_balance')
+    # Статистику пишуть переносимі upsert-и - їх просто повторюємо локально
+    REPLAY_TABLES = ('stats_tally', 'stats_days', 'stats_streaks')
+    CHUNK = 10000
+
+    def __init__(self):
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        init_sqlite_schema(self.db)
+        self.lock = threading.Lock()
+        self.synced_at = 0
+
+    def columns(self, table):
+        return [row[1] for row in self.db.execute(f"PRAGMA table_info({table})")]
+
+    def query(self, query, params=()):
+        with self.lock:
+            return self.db.execute(query.replace('%%', '%').replace('%s', '?'), params or ()).fetchall()
+
+    def refresh(self, pg_conn):
+        """Повна звірка, якщо з останньої минуло більше MIRROR_REFRESH_SECONDS"""
+        if time.time() - self.synced_at > MIRROR_REFRESH_SECONDS:
+            self.sync(pg_conn)
+            self.synced_at = time.time()
+
+    def sync(self, pg_conn, tables=None):
+        # Довідники - першими: тригер tasks_fts бере назву типу задачі з уже скопійованих piece_types
+        order = self.SMALL_TABLES + self.APPEND_TABLES + self.REPLAY_TABLES
+        with self.lock:
+            for table in [table for table in order if tables is None or table in tables]:
+                if table in self.APPEND_TABLES:
+                    self._pull_new(pg_conn, table)
+                elif table in self.SMALL_TABLES + self.REPLAY_TABLES:
+                    self._reload(pg_conn, table)
+            self.db.commit()
+
+    def apply(self, pg_conn, statements):
+        """Оновлює дзеркало після коміту записів у PostgreSQL"""
+        tables = []
+        for query, params in statements:
+            for table in WRITE_TARGET.findall(query):
+                if table in self.REPLAY_TABLES:
+                    try:
+                        self.query(query, params)
+                        continue
+                    except sqlite3.Error:
+                        pass
+                if table not in tables:
+                    tables.append(table)
+                # UPDATE/DELETE у великих таблицях повторюємо локально, щоб не перечитувати їх цілком
+                if table in self.APPEND_TABLES and not query.lstrip().upper().startswith('INSERT'):
+                    try:
+                        self.query(query, params)
+                    except sqlite3.Error:
+                        with self.lock:
+                            self.db.execute(f"DELETE FROM {table}")
+        if tables:
+            self.sync(pg_conn, tables)
+        else:
+            with self.lock:
+                self.db.commit()
+
+    def _pull_new(self, pg_conn, table, verify=True):
+        cols = self.columns(table)
+        c = pg_conn.cursor()
+        while True:
+            high_water = self.db.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            c.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                      (high_water, self.CHUNK))
+            rows = c.fetchall()
+            self.db.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", rows)
+            if len(rows) < self.CHUNK:
+                break
+
+        # Рядки, видалені поза цим процесом, видно лише за розбіжністю кількості
+        if not verify:
+            return
+        c.execute(f"SELECT COUNT(*) FROM {table}")
+        if c.fetchone()[0] != self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]:
+            self.db.execute(f"DELETE FROM {table}")
+            self._pull_new(pg_conn, table, verify=False)
+
+    def _reload(self, pg_conn, table):
+        cols = self.columns(table)
+        c = pg_conn.cursor()
+        c.execute(f"SELECT {', '.join(cols)} FROM {table}")
+        if table == 'piece_types':
+            names = dict(self.db.execute("SELECT code, name FROM piece_types").fetchall())
+        self.db.execute(f"DELETE FROM {table}")
+        self.db.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", c.fetchall())
+        if table == 'piece_types':
+            self._rename_pieces(names)
+
+    def _rename_pieces(self, old_names):
+        """DELETE + INSERT оминає тригер перейменування: назви в tasks_fts оновлюємо для нових і змінених типів"""
+        for code, name in self.db.execute("SELECT code, name FROM piece_types").fetchall():
+            if old_names.get(code) != name:
+                self.db.execute("UPDATE tasks_fts SET piece_name = ? WHERE rowid IN (SELECT id FROM tasks WHERE piece_type = ?)",
+                                (name, code))
+
+class MirroredConnection:
+    """З'єднання для сторінок: SELECT-и йдуть у ReadMirror, усі записи - в PostgreSQL"""
+
+    def __init__(self, conn, mirror):
+        self.conn = conn
+        self.mirror = mirror
+        self.pending = []
+
+    def cursor(self):
+        return MirroredCursor(self)
+
+    def commit(self):
+        self.conn.commit()
+        pending, self.pending = self.pending, []
+        if pending:
+            self.mirror.apply(self.conn, pending)
+
+    def rollback(self):
+        self.conn.rollback()
+        self.pending = []
+
+    def close(self):
+        self.conn.close()
+
+class MirroredCursor:
+    def __init__(self, owner):
+        self.owner = owner
+        self.pg = owner.conn.cursor()
+        self.rows = None
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        if READ_QUERY.match(query) and PRIMARY_READ.search(query):
+            self.pg.execute(query, params)
+            self.rows = None
+            self.rowcount = self.pg.rowcount
+        elif READ_QUERY.match(query):
+            self.rows = iter(self.owner.mirror.query(query, params))
+            self.rowcount = -1
+        else:
+            self.pg.execute(query, params)
+            self.owner.pending.append((query, params))
+            self.rows = None
+            self.rowcount = self.pg.rowcount
+        return self
+
+    def executemany(self, query, params_seq):
+        params_seq = list(params_seq)
+        self.pg.executemany(query, params_seq)
+        self.owner.pending.extend((query, params) for params in params_seq)
+        self.rows = None
+        self.rowcount = self.pg.rowcount
+        return self
+
+    def fetchone(self):
+        return self.pg.fetchone() if self.rows is None else next(self.rows, None)
+
+    def fetchall(self):
+        return self.pg.fetchall() if self.rows is None else list(self.rows)
+
+@st.cache_resource
+def get_read_mirror():
+    return ReadMirror()
+
+def primary_cursor(conn):
+    """Курсор самої БД, повз дзеркало: читання всередині транзакції запису мають бачити свіжі дані"""
+    return conn.conn.cursor() if isinstance(conn, MirroredConnection) else conn.cursor()
+
+def reads_sqlite(conn):
+    """Чи виконуються SELECT-и цього з'єднання в SQLite (локальна БД або дзеркало)"""
+    return not IS_CLOUD or isinstance(conn, MirroredConnection)
+
+# ============= RENDER CACHE =============
+class OfflineMiss(Exception):
+    """Немає зв'язку з БД, а в кеші рендеру немає останнього відомого значення"""
+
+class RenderCache:
+    """LRU-кеш результатів запитів і DataFrame-ів, дійсний до наступного запису в БД"""
+
+    def __init__(self, maxsize=RENDER_CACHE_SIZE, ttl=RENDER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        # Останнє прочитане значення data_version з БД
+        self.data_version = None
+        self.entries = OrderedDict()
+        # Останні відомі значення, які запис не скидає: з них сторінки малюються без зв'язку з БД
+        self.known = OrderedDict()
+        self.lock = threading.Lock()
+
+    def bump(self):
+        """Нова версія даних: усе, що обчислено раніше, більше не видається"""
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    def get(self, key, compute):
+        with self.lock:
+            version = self.version
+            entry = self.entries.get(key)
+            if entry and entry[0] == version and time.time() - entry[1] < self.ttl:
+                self.entries.move_to_end(key)
+                return entry[2]
+
+        value = compute()
+
+        with self.lock:
+            # Якщо поки рахували, відбувся запис - результат уже застарів
+            if version == self.version:
+                self.entries[key] = (version, time.time(), value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            self.known[key] = value
+            self.known.move_to_end(key)
+            while len(self.known) > self.maxsize:
+                self.known.popitem(last=False)
+        return value
+
+    def last_known(self, key):
+        with self.lock:
+            if key not in self.known:
+                raise OfflineMiss(key)
+            self.known.move_to_end(key)
+            return self.known[key]
+
+@st.cache_resource
+def get_render_cache():
+    return RenderCache()
+
+def cached(key, compute):
+    """Результат compute() з кешу рендеру; перераховується лише після запису в БД.
+    Без зв'язку (прогін з conn=None) - останнє відоме значення"""
+    if st.session_state.get('offline'):
+        return get_render_cache().last_known(key)
+    return get_render_cache().get(key, compute)
+
+def offline_section(render, *args):
+    """Частина сторінки; без зв'язку і без даних у кеші - підпис замість неї"""
+    try:
+        render(*args)
+    except OfflineMiss:
+        st.caption("Раздел появится после восстановления связи с базой")
+
+def commit(conn):
+    """Коміт запису + нова версія даних: у БД (для інших процесів) і в кеші рендеру цього процесу"""
+    version = bump_data_version(conn)
+    conn.commit()
+    cache = get_render_cache()
+    cache.bump()
+    # Версія зросла рівно на один - між прогонами писали лише ми, наступний прогін кеш не скидає
+    if cache.data_version is not None and version == cache.data_version + 1:
+        cache.data_version = version
+
+def bump_data_version(conn):
+    """У транзакції запису, з будь-якого процесу: сторінки інших процесів побачать зміни, не чекаючи TTL кешу.
+    Повертає нову версію"""
+    c = conn.cursor()
+    c.execute("UPDATE data_version SET version = version + 1 WHERE id = 1 RETURNING version")
+    rows = c.fetchall()
+    return rows[0][0] if rows else None
+
+def check_data_version(conn):
+    """Скидає кеш рендеру, якщо з минулого прогону в БД писав інший процес. True - якщо писав"""
+    c = conn.cursor()
+    c.execute("SELECT version FROM data_version WHERE id = 1")
+    row = c.fetchone()
+    version = row[0] if row else 0
+    cache = get_render_cache()
+    if cache.data_version == version:
+        return False
+    if cache.data_version is not None:
+        cache.bump()
+    cache.data_version = version
+    return True
+
 # ============= XP & COINS ENGINE =============
 def get_tier_mult(conn, front_code, tier):
     c = conn.cursor()
@@ -390,7 +1037,7 @@ def calc_task_xp(task, conn):
     c = conn.cursor()
     c.execute("SELECT base_xp FROM piece_types WHERE code=%s" if IS_CLOUD else "SELECT base_xp FROM piece_types WHERE code=?", (task['piece_type'],))
     row = c.fetchone()
-    base_xp = row['base_xp'] if IS_CLOUD and row else (row[0] if row else 10)
+    base_xp = row[0] if row else 10
     
     # Множитель минут: каждые 10 минут = x1
     minutes_mult = max(1, task['minutes'] / 10)
@@ -421,15 +1068,102 @@ def get_next_threshold(level, conn):
 
 def get_total_coins(conn):
     c = conn.cursor()
-    c.execute("SELECT SUM(coins_earned) FROM tasks")
-    earned = c.fetchone()[0] or 0
-    c.execute("SELECT SUM(amount) FROM coins_log")
-    bonuses = c.fetchone()[0] or 0
-    c.execute("SELECT SUM(coins_spent) FROM purchases")
-    spent = c.fetchone()[0] or 0
-    return earned + bonuses - spent
+    c.execute("SELECT coins FROM coin_balance WHERE id = 1")
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def compute_total_coins(conn):
+    """Баланс, перерахований з усієї історії, - для звірки і перерахунку coin_balance"""
+    c = conn.cursor()
+    c.execute(f"SELECT {BALANCE_SQL}")
+    return c.fetchone()[0] or 0
+
+def add_coins(conn, amount):
+    """Змінює coin_balance у поточній транзакції запису (amount < 0 - списання)"""
+    c = conn.cursor()
+    c.execute("UPDATE coin_balance SET coins = coins + %s WHERE id = 1" if IS_CLOUD else
+              "UPDATE coin_balance SET coins = coins + ? WHERE id = 1", (amount,))
+
+def reset_coin_balance(conn):
+    """coin_balance = баланс з усієї історії (без коміту) - після масових змін"""
+    c = conn.cursor()
+    if IS_CLOUD:
+        # Спершу блокуємо рядок: підзапити UPDATE мають бачити покупки, що чекали на нього
+        c.execute("SELECT coins FROM coin_balance WHERE id = 1 FOR UPDATE")
+    c.execute(f"UPDATE coin_balance SET coins = {BALANCE_SQL} WHERE id = 1")
+
+def purchase_reward(conn, reward_id, cost, date=None):
+    """Атомарна покупка: баланс списується і покупка записується лише якщо баланс покриває ціну"""
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    c = conn.cursor()
+    if IS_CLOUD:
+        # UPDATE блокує рядок балансу: паралельна покупка чекає коміту і перевіряє вже новий баланс.
+        # Списання і покупка - один оператор, один round trip до сервера
+        c.execute("""
+            WITH paid AS (
+                UPDATE coin_balance SET coins = coins - %s WHERE id = 1 AND coins >= %s RETURNING id
+            )
+            INSERT INTO purchases (date, reward_id, coins_spent)
+            SELECT %s, %s, %s FROM paid
+        """, (cost, cost, date, reward_id, cost))
+        bought = c.rowcount == 1
+    else:
+        # Пишучий оператор SQLite бере RESERVED-блокування до читання балансу, тож перевірка і списання атомарні
+        c.execute("UPDATE coin_balance SET coins = coins - ? WHERE id = 1 AND coins >= ?", (cost, cost))
+        bought = c.rowcount == 1
+        if bought:
+            c.execute("INSERT INTO purchases (date, reward_id, coins_spent) VALUES (?, ?, ?)", (date, reward_id, cost))
+    commit(conn)
+    return bought
+
+def get_overall_xp(conn):
+    c = conn.cursor()
+    c.execute("SELECT SUM(t.total_xp * f.weight) FROM task_totals t JOIN fronts f ON t.front_code = f.code")
+    return c.fetchone()[0] or 0
+
+def log_task(conn, task):
+    """Записує задачу з розрахованими XP/монетами та нараховує бонус за рівень: (total_xp, coins, bonus)"""
+    old_level = get_level(get_overall_xp(conn), conn)
+
+    total_xp = calc_task_xp(task, conn)
+    coins = total_xp
+
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO tasks (date, front_code, tier, piece_type, note, minutes, difficulty, status, total_xp, coins_earned)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """ if IS_CLOUD else """
+        INSERT INTO tasks (date, front_code, tier, piece_type, note, minutes, difficulty, status, total_xp, coins_earned)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (task['date'], task['front_code'], task['tier'], task['piece_type'],
+          task['note'], task['minutes'], task['difficulty'], task['status'], total_xp, coins))
+    update_stats(conn, task['front_code'], task['tier'], task['status'], task['date'], 1)
+    add_coins(conn, coins)
+    commit(conn)
+
+    new_level = get_level(get_overall_xp(conn), conn)
+    bonus = check_levelup_bonus(conn, old_level, new_level)
+    return total_xp, coins, bonus
+
+def delete_task(conn, task_id):
+    c = conn.cursor()
+    # Видалений рядок повертає сама БД: окреме читання могло б піти в застаріле дзеркало
+    c.execute("DELETE FROM tasks WHERE id=%s RETURNING front_code, tier, status, date, coins_earned" if IS_CLOUD else
+              "DELETE FROM tasks WHERE id=? RETURNING front_code, tier, status, date, coins_earned", (task_id,))
+    rows = c.fetchall()
+    if rows:
+        update_stats(conn, *rows[0][:4], -1)
+        add_coins(conn, -(rows[0][4] or 0))
+    commit(conn)
 
 def check_levelup_bonus(conn, old_level, new_level):
+    bonus = award_levelup_bonus(conn, old_level, new_level)
+    if bonus:
+        commit(conn)
+    return bonus
+
+def award_levelup_bonus(conn, old_level, new_level):
+    """Бонус за новий рівень у поточній транзакції, без коміту: сума бонусу або 0"""
     if new_level > old_level:
         c = conn.cursor()
         c.execute("SELECT xp_threshold FROM level_thresholds WHERE level=%s" if IS_CLOUD else
@@ -441,7 +1175,7 @@ def check_levelup_bonus(conn, old_level, new_level):
                       "INSERT INTO coins_log (date, source, amount, description) VALUES (?, ?, ?, ?)",
                      (datetime.now().strftime('%Y-%m-%d'), 'levelup', bonus,
                       f'Бонус за достижение уровня {new_level}'))
-            conn.commit()
+            add_coins(conn, bonus)
             return bonus
     return 0
 
@@ -457,16 +1191,498 @@ def set_user_pref(conn, key, value):
         c.execute("INSERT INTO user_prefs (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value", (key, value))
     else:
         c.execute("INSERT OR REPLACE INTO user_prefs (key, value) VALUES (?, ?)", (key, value))
+    commit(conn)
+
+# ============= WRITE JOURNAL =============
+def db_busy(e):
+    """Блокування або таймаут запиту: БД на місці, запис варто повторити пізніше"""
+    if isinstance(e, sqlite3.OperationalError):
+        return 'locked' in str(e) or 'busy' in str(e)
+    return IS_CLOUD and isinstance(e, (psycopg2.extensions.QueryCanceledError, psycopg2.extensions.TransactionRollbackError,
+                                       psycopg2.errors.LockNotAvailable))
+
+def db_unreachable(e):
+    """Збій зв'язку з БД: лише після нього запис відкладається в журнал, а сторінки перестають її чекати"""
+    if isinstance(e, sqlite3.OperationalError):
+        return 'unable to open database file' in str(e)
+    return IS_CLOUD and isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and not db_busy(e)
+
+def apply_op(conn, op):
+    """Застосовує запис журналу рівно один раз: мітка в applied_ops комітиться разом із самим записом.
+    Повертає результат запису або None, якщо його вже застосовано раніше"""
+    c = conn.cursor()
+    c.execute("INSERT INTO applied_ops (op_id, kind, applied_at) VALUES (%s, %s, %s) ON CONFLICT (op_id) DO NOTHING" if IS_CLOUD else
+              "INSERT OR IGNORE INTO applied_ops (op_id, kind, applied_at) VALUES (?, ?, ?)",
+              (op['id'], op['kind'], datetime.now().isoformat(timespec='seconds')))
+    if c.rowcount != 1:
+        conn.rollback()
+        return None
+
+    payload = op['payload']
+    if op['kind'] == 'task':
+        return log_task(conn, payload)
+    if op['kind'] == 'purchase':
+        return purchase_reward(conn, payload['reward_id'], payload['cost'], payload['date'])
+    if op['kind'] == 'delete':
+        delete_task(conn, payload['task_id'])
+        return True
+    set_user_pref(conn, payload['key'], payload['value'])
+    return True
+
+def prune_applied_ops(conn):
+    """Старі мітки вже не потрібні: запис зникає з журналу одразу після коміту"""
+    cutoff = (datetime.now() - timedelta(days=APPLIED_OPS_KEEP_DAYS)).isoformat(timespec='seconds')
+    c = conn.cursor()
+    c.execute("DELETE FROM applied_ops WHERE applied_at < %s" if IS_CLOUD else
+              "DELETE FROM applied_ops WHERE applied_at < ?", (cutoff,))
     conn.commit()
 
+class WriteJournal:
+    """Append-only журнал на диску для записів, які не вдалося донести до БД.
+    Переживає перезапуск; записи повторюються в тому ж порядку, кожен рівно один раз"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.failed_path = path.with_name(path.stem + '.failed.jsonl')
+        self.lock = threading.Lock()
+        self.offline_until = 0
+        self.ops = []
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            for line in lines:
+                try:
+                    self.ops.append(json.loads(line))
+                except ValueError:
+                    pass
+            # Рядок, обірваний збоєм посеред дозапису, прибираємо, щоб до нього не приклеївся наступний
+            if len(self.ops) != len(lines):
+                self._rewrite()
+
+    def _rewrite(self):
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(op, ensure_ascii=False) + '\n' for op in self.ops)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+
+    def append(self, op):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(op, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.ops.append(op)
+
+    def online(self):
+        return time.time() >= self.offline_until
+
+    def went_offline(self, conn=None):
+        """БД не відповідає: до OFFLINE_RETRY_SECONDS сторінки її не чекають"""
+        self.offline_until = time.time() + OFFLINE_RETRY_SECONDS
+        if conn is not None:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
+    def replay(self, conn):
+        """Застосовує накопичені записи по черзі; на збої зв'язку чи блокуванні зупиняється і прокидає помилку далі.
+        Запис, який БД відхиляє (помилка в самому запиті), переноситься в journal.failed.jsonl, щоб не блокувати решту.
+        Повертає кількість застосованих записів"""
+        with self.lock:
+            done, failed = 0, []
+            try:
+                for op in self.ops:
+                    try:
+                        apply_op(conn, op)
+                    except Exception as e:
+                        if db_unreachable(e) or db_busy(e):
+                            raise
+                        conn.rollback()
+                        failed.append(dict(op, error=f"{type(e).__name__}: {e}"))
+                    done += 1
+            finally:
+                if failed:
+                    with open(self.failed_path, 'a', encoding='utf-8') as f:
+                        f.writelines(json.dumps(op, ensure_ascii=False) + '\n' for op in failed)
+                if done:
+                    self.ops = self.ops[done:]
+                    self._rewrite()
+            return done - len(failed)
+
+@st.cache_resource
+def get_write_journal():
+    return WriteJournal()
+
+def write_op(conn, kind, payload):
+    """Запис з UI: одразу в БД, а якщо вона недоступна - у журнал.
+    Повертає результат запису або None, якщо запис відкладено до відновлення зв'язку"""
+    journal = get_write_journal()
+    op = {'id': uuid.uuid4().hex, 'kind': kind, 'at': datetime.now().isoformat(timespec='seconds'), 'payload': payload}
+    if conn is not None and journal.online():
+        try:
+            # Новий запис не може обігнати ті, що вже чекають у журналі
+            if journal.ops:
+                journal.replay(conn)
+            if not journal.ops:
+                return apply_op(conn, op)
+        except Exception as e:
+            # Заблокована БД - не відсутність зв'язку: помилка доходить до користувача, запис не відкладається
+            if not db_unreachable(e):
+                conn.rollback()
+                raise
+            # Коміт міг дійти до БД: той самий id у журналі не дасть застосувати запис двічі
+            journal.went_offline(conn)
+    journal.append(op)
+    return None
+
+def offline_notice():
+    journal = get_write_journal()
+    st.warning(f"Нет связи с базой данных. Действия сохраняются локально и будут записаны после "
+               f"восстановления связи (в очереди: {len(journal.ops)}).")
+    if st.button("Повторить подключение"):
+        journal.offline_until = 0
+        st.rerun()
+
+# ============= STATS =============
+def compute_streak(dates):
+    """По відсортованих датах з виконаними задачами: (початок, кінець останньої серії, найдовша серія)"""
+    run_start = run_end = None
+    longest = 0
+    for date in dates:
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+        if run_end is not None and day == run_end + timedelta(days=1):
+            run_end = day
+        elif run_end != day:
+            run_start = run_end = day
+        longest = max(longest, (run_end - run_start).days + 1)
+    if run_end is None:
+        return None, None, 0
+    return run_start.isoformat(), run_end.isoformat(), longest
+
+def save_streak(conn, scope, run_start, run_end, longest):
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO stats_streaks (scope, run_start, run_end, longest) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (scope) DO UPDATE SET run_start = EXCLUDED.run_start, run_end = EXCLUDED.run_end, longest = EXCLUDED.longest
+    """ if IS_CLOUD else """
+        INSERT INTO stats_streaks (scope, run_start, run_end, longest) VALUES (?, ?, ?, ?)
+        ON CONFLICT (scope) DO UPDATE SET run_start = EXCLUDED.run_start, run_end = EXCLUDED.run_end, longest = EXCLUDED.longest
+    """, (scope, run_start, run_end, longest))
+
+def update_streak(conn, scope, date, added):
+    """Серія після появи (added) чи зникнення дня з виконаними задачами"""
+    c = primary_cursor(conn)
+    if IS_CLOUD:
+        # Рядок серії блокуємо: паралельний запис іншого дня чекає і читає вже нову серію.
+        # Щоб було що блокувати, порожній рядок створюємо заздалегідь
+        conn.cursor().execute("INSERT INTO stats_streaks (scope, longest) VALUES (%s, 0) ON CONFLICT (scope) DO NOTHING", (scope,))
+    c.execute("SELECT run_start, run_end, longest FROM stats_streaks WHERE scope=%s FOR UPDATE" if IS_CLOUD else
+              "SELECT run_start, run_end, longest FROM stats_streaks WHERE scope=?", (scope,))
+    row = c.fetchone()
+
+    # Звичайний випадок - новий день після останньої серії: O(1)
+    if added and (row is None or row[1] is None):
+        return save_streak(conn, scope, date, date, max(row[2] if row else 0, 1))
+    if added:
+        run_start, run_end, longest = row
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+        last = datetime.strptime(run_end, '%Y-%m-%d').date()
+        if day == last + timedelta(days=1):
+            length = (day - datetime.strptime(run_start, '%Y-%m-%d').date()).days + 1
+            return save_streak(conn, scope, run_start, date, max(longest, length))
+        if day > last:
+            return save_streak(conn, scope, date, date, max(longest, 1))
+
+    # Запис заднім числом або видалення дня: серії могли злитися чи розірватися - перераховуємо по днях
+    c.execute("SELECT date FROM stats_days WHERE scope=%s AND done > 0" if IS_CLOUD else
+              "SELECT date FROM stats_days WHERE scope=? AND done > 0", (scope,))
+    dates = {d for (d,) in c.fetchall()}
+    if added:
+        dates.add(date)
+    else:
+        dates.discard(date)
+    save_streak(conn, scope, *compute_streak(sorted(dates)))
+
+def update_stats(conn, front_code, tier, status, date, delta):
+    """Інкрементально веде статистику після вставки (delta=1) чи видалення (delta=-1) задачі, в тій самій транзакції"""
+    c = conn.cursor()
+    for scope in (front_code, ''):
+        c.execute("""
+            INSERT INTO stats_tally (scope, tier, status, n) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (scope, tier, status) DO UPDATE SET n = stats_tally.n + EXCLUDED.n
+        """ if IS_CLOUD else """
+            INSERT INTO stats_tally (scope, tier, status, n) VALUES (?, ?, ?, ?)
+            ON CONFLICT (scope, tier, status) DO UPDATE SET n = stats_tally.n + EXCLUDED.n
+        """, (scope, tier, status, delta))
+
+        if status != 'Done':
+            continue
+
+        # Відносний upsert: паралельні записи того самого дня не затирають один одного,
+        # а перехід дня визначаємо за значенням, яке повернула сама БД
+        c.execute("""
+            INSERT INTO stats_days (scope, date, done) VALUES (%s, %s, %s)
+            ON CONFLICT (scope, date) DO UPDATE SET done = stats_days.done + EXCLUDED.done
+            RETURNING done
+        """ if IS_CLOUD else """
+            INSERT INTO stats_days (scope, date, done) VALUES (?, ?, ?)
+            ON CONFLICT (scope, date) DO UPDATE SET done = stats_days.done + EXCLUDED.done
+            RETURNING done
+        """, (scope, date, delta))
+        after = c.fetchall()[0][0]
+        before = after - delta
+        if after <= 0:
+            c.execute("DELETE FROM stats_days WHERE scope=%s AND date=%s" if IS_CLOUD else
+                      "DELETE FROM stats_days WHERE scope=? AND date=?", (scope, date))
+
+        # Серії змінюються лише коли день стає (або перестає бути) днем з виконаними задачами
+        if (before > 0) != (after > 0):
+            update_streak(conn, scope, date, after > 0)
+
+def rebuild_stats(conn):
+    """Повний перерахунок статистики з task_totals і балансу - запасний шлях для масових змін"""
+    c = conn.cursor()
+    c.execute("SELECT front_code, tier, status, SUM(task_count) FROM task_totals GROUP BY front_code, tier, status")
+    tally = {}
+    for front_code, tier, status, n in c.fetchall():
+        for scope in (front_code, ''):
+            tally[scope, tier, status] = tally.get((scope, tier, status), 0) + n
+
+    c.execute("SELECT front_code, date, SUM(task_count) FROM task_totals WHERE status='Done' GROUP BY front_code, date")
+    days = {}
+    for front_code, date, n in c.fetchall():
+        for scope in (front_code, ''):
+            days[scope, date] = days.get((scope, date), 0) + n
+
+    dates = {}
+    for scope, date in days:
+        dates.setdefault(scope, []).append(date)
+
+    ph = '%s' if IS_CLOUD else '?'
+    c.execute("DELETE FROM stats_tally")
+    c.execute("DELETE FROM stats_days")
+    c.execute("DELETE FROM stats_streaks")
+    c.executemany(f"INSERT INTO stats_tally (scope, tier, status, n) VALUES ({ph}, {ph}, {ph}, {ph})",
+                  [key + (n,) for key, n in tally.items()])
+    c.executemany(f"INSERT INTO stats_days (scope, date, done) VALUES ({ph}, {ph}, {ph})",
+                  [key + (n,) for key, n in days.items()])
+    c.executemany(f"INSERT INTO stats_streaks (scope, run_start, run_end, longest) VALUES ({ph}, {ph}, {ph}, {ph})",
+                  [(scope,) + compute_streak(sorted(scope_dates)) for scope, scope_dates in dates.items()])
+    reset_coin_balance(conn)
+    commit(conn)
+
+def load_stats(conn, scope, today):
+    """Серії та відсотки виконання для фронту ('' - загальні): два точкові запити незалежно від історії"""
+    c = conn.cursor()
+    c.execute("SELECT run_start, run_end, longest FROM stats_streaks WHERE scope=%s" if IS_CLOUD else
+              "SELECT run_start, run_end, longest FROM stats_streaks WHERE scope=?", (scope,))
+    row = c.fetchone()
+    current, longest = 0, 0
+    if row and row[1]:
+        longest = row[2]
+        run_end = datetime.strptime(row[1], '%Y-%m-%d').date()
+        # Серія жива, поки вчорашній день закритий - сьогодні ще є час
+        if run_end >= datetime.strptime(today, '%Y-%m-%d').date() - timedelta(days=1):
+            current = (run_end - datetime.strptime(row[0], '%Y-%m-%d').date()).days + 1
+
+    c.execute("SELECT tier, status, n FROM stats_tally WHERE scope=%s" if IS_CLOUD else
+              "SELECT tier, status, n FROM stats_tally WHERE scope=?", (scope,))
+    done, total = {}, {}
+    for tier, status, n in c.fetchall():
+        total[tier] = total.get(tier, 0) + n
+        if status == 'Done':
+            done[tier] = done.get(tier, 0) + n
+    all_total = sum(total.values())
+    all_done = sum(done.values())
+
+    return {
+        'current_streak': current, 'longest_streak': longest,
+        'completion': {tier: done.get(tier, 0) / total[tier] for tier in TIERS if total.get(tier)},
+        'done_rate': all_done / all_total if all_total else None,
+        'miss_rate': (all_total - all_done) / all_total if all_total else None,
+    }
+
+def render_stats(stats):
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Серия дней", stats['current_streak'])
+    col2.metric("Рекорд серии", stats['longest_streak'])
+    col3.metric("Выполнено", f"{stats['done_rate']:.0%}" if stats['done_rate'] is not None else "—")
+    col4.metric("Провалы/пропуски", f"{stats['miss_rate']:.0%}" if stats['miss_rate'] is not None else "—")
+    if stats['completion']:
+        st.caption("Выполнение по тирам: " + " · ".join(f"{tier} {rate:.0%}" for tier, rate in stats['completion'].items()))
+
+# ============= TIMELINE =============
+def date_bucket_sql(conn, granularity, column='date'):
+    """SQL-вираз, що зводить текстову дату YYYY-MM-DD до початку дня/тижня/місяця"""
+    if granularity == 'month':
+        return f"substr({column}, 1, 7) || '-01'"
+    if granularity == 'week':
+        if not reads_sqlite(conn):
+            return f"to_char(date_trunc('week', {column}::date), 'YYYY-MM-DD')"
+        # найближча неділя мінус 6 днів = понеділок цього тижня
+        return f"date({column}, 'weekday 0', '-6 days')"
+    return column
+
+def get_timeline(conn, granularity, front_code=None):
+    """Агрегує XP та монети по періодах на боці БД: [(period, xp, coins), ...]"""
+    c = conn.cursor()
+    if front_code:
+        c.execute(f"""
+            SELECT {date_bucket_sql(conn, granularity)} AS period, SUM(total_xp), SUM(coins_earned)
+            FROM task_totals
+            WHERE front_code = {'%s' if IS_CLOUD else '?'}
+            GROUP BY period
+            ORDER BY period
+        """, (front_code,))
+    else:
+        # Загальний графік: XP з вагою фронту, монети = зароблені + бонуси - витрачені
+        c.execute(f"""
+            SELECT period, SUM(xp), SUM(coins) FROM (
+                SELECT {date_bucket_sql(conn, granularity, 't.date')} AS period,
+                       t.total_xp * COALESCE(f.weight, 0) AS xp, t.coins_earned AS coins
+                FROM task_totals t
+                LEFT JOIN fronts f ON t.front_code = f.code
+                UNION ALL
+                SELECT {date_bucket_sql(conn, granularity)}, 0, amount FROM coins_log
+                UNION ALL
+                SELECT {date_bucket_sql(conn, granularity)}, 0, -coins_spent FROM purchases
+            ) s
+            GROUP BY period
+            ORDER BY period
+        """)
+    return c.fetchall()
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets: проріджує ряд [(x, y), ...] до threshold точок, зберігаючи форму"""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Середня точка наступного кошика - третя вершина трикутника
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / (avg_end - avg_start)
+
+        ax, ay = points[a]
+        best, best_area = None, -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+def build_timeline_frames(rows, cumulative=False, points=TIMELINE_POINTS):
+    """DataFrame-и для графіків XP та монет, не більше points точок кожен (None, якщо даних немає)"""
+    if not rows:
+        return None
+
+    xp_series, coins_series = [], []
+    xp_total = coins_total = 0
+    for period, xp, coins in rows:
+        x = datetime.strptime(period, '%Y-%m-%d').toordinal()
+        xp_total = xp_total + (xp or 0) if cumulative else (xp or 0)
+        coins_total = coins_total + (coins or 0) if cumulative else (coins or 0)
+        xp_series.append((x, xp_total))
+        coins_series.append((x, coins_total))
+
+    def to_frame(series, column):
+        sampled = lttb(series, points)
+        return pd.DataFrame({'Дата': [datetime.fromordinal(x) for x, _ in sampled],
+                             column: [round(y, 1) for _, y in sampled]})
+
+    return to_frame(xp_series, 'XP'), to_frame(coins_series, 'Никоины')
+
+def render_timeline(conn, front_code=None):
+    """Графіки динаміки XP та монет з вибором гранулярності"""
+    key = front_code or 'overall'
+    col1, col2 = st.columns([3, 1])
+    label = col1.radio("Период", list(TIMELINE_GRANULARITY), horizontal=True, key=f"tl_gran_{key}")
+    cumulative = col2.checkbox("Накопительно", key=f"tl_cum_{key}")
+
+    granularity = TIMELINE_GRANULARITY[label]
+    frames = cached(('timeline', front_code, granularity, cumulative),
+                    lambda: build_timeline_frames(get_timeline(conn, granularity, front_code), cumulative))
+    if frames is None:
+        st.info("Пока нет данных для графиков")
+        return
+
+    xp_df, coins_df = frames
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(px.line(xp_df, x='Дата', y='XP', title="XP"), use_container_width=True)
+    col2.plotly_chart(px.line(coins_df, x='Дата', y='Никоины', title="Никоины"), use_container_width=True)
+
+# ============= SEARCH =============
+def search_tasks(conn, text, front_code=None, date_from=None, date_to=None, limit=SEARCH_LIMIT):
+    """Ранжований повнотекстовий пошук по нотатках і назвах задач:
+    [(id, date, front, piece, status, xp, snippet), ...]"""
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return []
+
+    ph = '%s' if IS_CLOUD else '?'
+    filters, params = '', []
+    if front_code:
+        filters += f" AND t.front_code = {ph}"
+        params.append(front_code)
+    if date_from:
+        filters += f" AND t.date >= {ph}"
+        params.append(date_from)
+    if date_to:
+        filters += f" AND t.date <= {ph}"
+        params.append(date_to)
+
+    c = conn.cursor()
+    if reads_sqlite(conn):
+        # Кожне слово - префіксний запит, слова об'єднуються через AND
+        c.execute(f"""
+            SELECT t.id, t.date, f.name, COALESCE(pt.name, t.piece_type), t.status, t.total_xp,
+                   snippet(tasks_fts, -1, '**', '**', '…', 12)
+            FROM tasks_fts
+            JOIN tasks t ON t.id = tasks_fts.rowid
+            LEFT JOIN piece_types pt ON pt.code = t.piece_type
+            LEFT JOIN fronts f ON f.code = t.front_code
+            WHERE tasks_fts MATCH {ph}{filters}
+            ORDER BY bm25(tasks_fts)
+            LIMIT {ph}
+        """, [' '.join(f'"{term}"*' for term in terms)] + params + [limit])
+    else:
+        c.execute(f"""
+            SELECT t.id, t.date, f.name, COALESCE(pt.name, t.piece_type), t.status, t.total_xp,
+                   ts_headline('simple', COALESCE(t.note, '') || ' ' || COALESCE(pt.name, t.piece_type), q,
+                               'StartSel=**, StopSel=**, MaxWords=12, MinWords=4')
+            FROM tasks t
+            CROSS JOIN to_tsquery('simple', {ph}) q
+            LEFT JOIN piece_types pt ON pt.code = t.piece_type
+            LEFT JOIN fronts f ON f.code = t.front_code
+            WHERE t.search_vector @@ q{filters}
+            ORDER BY ts_rank(t.search_vector, q) DESC, t.id DESC
+            LIMIT {ph}
+        """, [' & '.join(f'{term}:*' for term in terms)] + params + [limit])
+    return c.fetchall()
+
 # ============= PAGES =============
-def dashboard_page(conn):
-    st.title("Дашборд")
+def load_front_list(conn):
+    c = conn.cursor()
+    c.execute("SELECT code, name FROM fronts ORDER BY name")
+    return c.fetchall()
 
+def load_dashboard(conn, today):
+    """Усі запити дашборду одним знімком - результат кешується до наступного запису"""
     c = conn.cursor()
 
-    c.execute("SELECT SUM(t.total_xp * f.weight) FROM tasks t JOIN fronts f ON t.front_code = f.code")
-    overall_xp = c.fetchone()[0] or 0
+    overall_xp = get_overall_xp(conn)
     overall_level = get_level(overall_xp, conn)
     next_threshold = get_next_threshold(overall_level, conn)
     c.execute("SELECT xp_threshold FROM level_thresholds WHERE level=%s" if IS_CLOUD else
@@ -474,23 +1690,17 @@ def dashboard_page(conn):
     row = c.fetchone()
     current_threshold = row[0] if row else 0
 
-    if next_threshold > current_threshold:
-        progress = max(0, min(100, (overall_xp - current_threshold) / (next_threshold - current_threshold) * 100))
-    else:
-        progress = 0
-
     total_coins = get_total_coins(conn)
 
-    today = datetime.now().strftime('%Y-%m-%d')
-    c.execute("SELECT SUM(t.total_xp * f.weight) FROM tasks t JOIN fronts f ON t.front_code = f.code WHERE t.date=%s" if IS_CLOUD else
-              "SELECT SUM(t.total_xp * f.weight) FROM tasks t JOIN fronts f ON t.front_code = f.code WHERE t.date=?", (today,))
+    c.execute("SELECT SUM(t.total_xp * f.weight) FROM task_totals t JOIN fronts f ON t.front_code = f.code WHERE t.date=%s" if IS_CLOUD else
+              "SELECT SUM(t.total_xp * f.weight) FROM task_totals t JOIN fronts f ON t.front_code = f.code WHERE t.date=?", (today,))
     today_xp = c.fetchone()[0] or 0
 
-    week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+    week_ago = (datetime.strptime(today, '%Y-%m-%d') - timedelta(days=7)).strftime('%Y-%m-%d')
     c.execute("""
         SELECT AVG(daily_xp) FROM (
             SELECT SUM(t.total_xp * f.weight) as daily_xp 
-            FROM tasks t 
+            FROM task_totals t 
             JOIN fronts f ON t.front_code = f.code
             WHERE t.date >= %s
             GROUP BY t.date
@@ -498,7 +1708,7 @@ def dashboard_page(conn):
     """ if IS_CLOUD else """
         SELECT AVG(daily_xp) FROM (
             SELECT SUM(t.total_xp * f.weight) as daily_xp 
-            FROM tasks t
+            FROM task_totals t
             JOIN fronts f ON t.front_code = f.code
             WHERE t.date >= ?
             GROUP BY t.date
@@ -506,45 +1716,72 @@ def dashboard_page(conn):
     """, (week_ago,))
     week_avg = c.fetchone()[0] or 0
 
+    c.execute("""
+        SELECT f.name, f.code, COALESCE(SUM(t.total_xp), 0) as total
+        FROM fronts f
+        LEFT JOIN task_totals t ON f.code = t.front_code
+        GROUP BY f.code, f.name
+        ORDER BY total DESC
+    """)
+    fronts = [(fname, fcode, fxp, get_level(fxp, conn)) for fname, fcode, fxp in c.fetchall()]
+
+    return {
+        'overall_xp': overall_xp, 'overall_level': overall_level,
+        'next_threshold': next_threshold, 'current_threshold': current_threshold,
+        'total_coins': total_coins, 'today_xp': today_xp, 'week_avg': week_avg,
+        'fronts': fronts,
+    }
+
+def dashboard_page(conn):
+    st.title("Дашборд")
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    data = cached(('dashboard', today), lambda: load_dashboard(conn, today))
+    overall_xp = data['overall_xp']
+    overall_level = data['overall_level']
+    next_threshold = data['next_threshold']
+    current_threshold = data['current_threshold']
+
+    if next_threshold > current_threshold:
+        progress = max(0, min(100, (overall_xp - current_threshold) / (next_threshold - current_threshold) * 100))
+    else:
+        progress = 0
+
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Сегодня XP", f"{today_xp:.0f}")
-    col2.metric("Средняя/неделя", f"{week_avg:.0f}")
+    col1.metric("Сегодня XP", f"{data['today_xp']:.0f}")
+    col2.metric("Средняя/неделя", f"{data['week_avg']:.0f}")
     col3.metric("Уровень", overall_level)
 
     icon_html = get_nikocoin_icon()
-    col4.markdown(f"**Никоинов** {icon_html} {total_coins:.0f}", unsafe_allow_html=True)
+    col4.markdown(f"**Никоинов** {icon_html} {data['total_coins']:.0f}", unsafe_allow_html=True)
 
     st.write(f"**Прогресс до уровня {overall_level + 1}:** {overall_xp:.0f} / {next_threshold}")
     st.progress(progress / 100.0)
 
+    render_stats(cached(('stats', '', today), lambda: load_stats(conn, '', today)))
+
     st.divider()
 
-    st.subheader("Фронты")
-    c.execute("""
-        SELECT f.name, f.code, COALESCE(SUM(t.total_xp), 0) as total
-        FROM fronts f
-        LEFT JOIN tasks t ON f.code = t.front_code
-        GROUP BY f.code, f.name
-        ORDER BY total DESC
-    """)
+    st.subheader("Динамика")
+    render_timeline(conn)
+
+    st.divider()
 
-    for fname, fcode, fxp in c.fetchall():
-        flvl = get_level(fxp, conn)
+    st.subheader("Фронты")
+    for fname, fcode, fxp, flvl in data['fronts']:
         st.metric(fname, f"Level {flvl}", f"{fxp:.0f} XP")
 
-def front_detail_page(conn, front_code):
+def load_front(conn, front_code):
+    """Заголовні дані фронту: назва, XP, рівень і пороги (None, якщо фронту немає)"""
     c = conn.cursor()
     c.execute("SELECT name FROM fronts WHERE code=%s" if IS_CLOUD else "SELECT name FROM fronts WHERE code=?", (front_code,))
     row = c.fetchone()
     if not row:
-        st.error("Фронт не найден")
-        return
-
-    front_name = row[0]
-    st.title(front_name)
+        return None
+    row_name = row[0]
 
-    c.execute("SELECT COALESCE(SUM(total_xp), 0) FROM tasks WHERE front_code=%s" if IS_CLOUD else
-              "SELECT COALESCE(SUM(total_xp), 0) FROM tasks WHERE front_code=?", (front_code,))
+    c.execute("SELECT COALESCE(SUM(total_xp), 0) FROM task_totals WHERE front_code=%s" if IS_CLOUD else
+              "SELECT COALESCE(SUM(total_xp), 0) FROM task_totals WHERE front_code=?", (front_code,))
     front_xp = c.fetchone()[0]
     front_level = get_level(front_xp, conn)
     next_threshold = get_next_threshold(front_level, conn)
@@ -557,6 +1794,161 @@ def front_detail_page(conn, front_code):
         row = c.fetchone()
         current_threshold = row[0] if row else 0
 
+    c.execute("SELECT xp_threshold FROM level_thresholds WHERE level=%s" if IS_CLOUD else
+              "SELECT xp_threshold FROM level_thresholds WHERE level=?", (front_level,))
+    levelup_bonus_row = c.fetchone()
+    levelup_bonus = levelup_bonus_row[0] if levelup_bonus_row else 100
+
+    return {
+        'name': row_name, 'xp': front_xp, 'level': front_level,
+        'next_threshold': next_threshold, 'current_threshold': current_threshold,
+        'levelup_bonus': levelup_bonus,
+    }
+
+def prefix_search(conn, table, pg_text, text):
+    """Умова "кожне слово text - початок слова в назві": (SQL, параметр) або None, якщо слів немає.
+    SQLite - FTS5-таблиця {table}_fts (rowid = id), PostgreSQL - GIN-індекс на to_tsvector(pg_text)"""
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return None
+    ph = '%s' if IS_CLOUD else '?'
+    if reads_sqlite(conn):
+        return f"id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH {ph})", ' '.join(f'"{term}"*' for term in terms)
+    return f"to_tsvector('simple', {pg_text}) @@ to_tsquery('simple', {ph})", ' & '.join(f'{term}:*' for term in terms)
+
+def load_piece_type_page(conn, front_code, tier, text='', exclude=(), page=0):
+    """Одна сторінка каталогу: тип задач тиру або, якщо задано text, пошук за початком слів назви/коду
+    по всіх тирах. Повертає ([(code, name, tier, base_xp)], скільки всього)"""
+    ph = '%s' if IS_CLOUD else '?'
+    where, params = [f"front_code = {ph}"], [front_code]
+    search = prefix_search(conn, 'piece_types', "name || ' ' || code", text)
+    if search:
+        where.append(search[0])
+        params.append(search[1])
+    else:
+        where.append(f"tier = {ph}")
+        params.append(tier)
+    if exclude:
+        where.append(f"code NOT IN ({', '.join([ph] * len(exclude))})")
+        params.extend(exclude)
+
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT code, name, tier, base_xp, COUNT(*) OVER ()
+        FROM piece_types
+        WHERE {' AND '.join(where)}
+        ORDER BY base_xp, name
+        LIMIT {ph} OFFSET {ph}
+    """, params + [PIECE_TYPE_PAGE, page * PIECE_TYPE_PAGE])
+    rows = c.fetchall()
+    return [row[:4] for row in rows], rows[0][4] if rows else 0
+
+def load_favorite_piece_types(conn, front_code, favorites):
+    """Обрані типи задач фронту в порядку, в якому їх закріпили"""
+    ph = '%s' if IS_CLOUD else '?'
+    c = conn.cursor()
+    c.execute(f"SELECT code, name, tier, base_xp FROM piece_types WHERE front_code = {ph} AND code IN ({', '.join([ph] * len(favorites))})",
+              [front_code] + list(favorites))
+    rows = {row[0]: row for row in c.fetchall()}
+    return [rows[code] for code in favorites if code in rows]
+
+def load_front_pie(conn, front_code):
+    """DataFrame розподілу XP по типах задач (None, якщо XP ще немає)"""
+    c = conn.cursor()
+    c.execute("""
+        SELECT pt.name, SUM(t.total_xp) as total
+        FROM task_totals t
+        JOIN piece_types pt ON t.piece_type = pt.code
+        WHERE t.front_code = %s
+        GROUP BY pt.code, pt.name
+        HAVING SUM(t.total_xp) > 0
+        ORDER BY total DESC
+    """ if IS_CLOUD else """
+        SELECT pt.name, SUM(t.total_xp) as total
+        FROM task_totals t
+        JOIN piece_types pt ON t.piece_type = pt.code
+        WHERE t.front_code = ?
+        GROUP BY pt.code
+        HAVING total > 0
+        ORDER BY total DESC
+    """, (front_code,))
+
+    chart_data = c.fetchall()
+    if not chart_data:
+        return None
+    return pd.DataFrame(chart_data, columns=['Задача', 'XP'])
+
+def load_front_history(conn, front_code):
+    c = conn.cursor()
+    c.execute("""
+        SELECT t.id, t.date, pt.name, t.status, t.total_xp
+        FROM tasks t
+        LEFT JOIN piece_types pt ON t.piece_type = pt.code
+        WHERE t.front_code = %s
+        ORDER BY t.date DESC, t.id DESC
+        LIMIT 20
+    """ if IS_CLOUD else """
+        SELECT t.id, t.date, pt.name, t.status, t.total_xp
+        FROM tasks t
+        LEFT JOIN piece_types pt ON t.piece_type = pt.code
+        WHERE t.front_code = ?
+        ORDER BY t.date DESC, t.id DESC
+        LIMIT 20
+    """, (front_code,))
+    return c.fetchall()
+
+def on_quick_log(conn, front_code, tier, task_code):
+    """Callback кнопки ✓: виконується до перерендеру фрагмента, тож той одразу бачить новий запис"""
+    task = {
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'front_code': front_code,
+        'tier': tier,
+        'piece_type': task_code,
+        'note': st.session_state.get(f"note_{front_code}", ''),
+        'minutes': st.session_state.get(f"min_{task_code}", 0),
+        'difficulty': st.session_state.get(f"diff_{front_code}", 2),
+        'status': 'Done'
+    }
+    st.session_state['quick_log_result'] = write_op(conn, 'task', task) or 'queued'
+    st.session_state[f"note_{front_code}"] = ''
+
+def on_delete_task(conn, task_id):
+    """Callback кнопки 🗑️: видалення йде тим самим шляхом через журнал, що й логування"""
+    if write_op(conn, 'delete', {'task_id': task_id}) is None:
+        st.session_state['delete_queued'] = True
+
+def on_toggle_favorite(conn, front_code, task_code):
+    favorites = st.session_state[f"favorites_{front_code}"]
+    favorites = [code for code in favorites if code != task_code] if task_code in favorites else favorites + [task_code]
+    st.session_state[f"favorites_{front_code}"] = favorites
+    write_op(conn, 'pref', {'key': f"fav_{front_code}", 'value': ','.join(favorites)})
+
+def on_reset_page(page_key):
+    st.session_state[page_key] = 0
+
+def on_turn_page(page_key, step):
+    st.session_state[page_key] += step
+
+def render_pager(page_key, page, total, page_size, label):
+    """Кнопки ← → і підпис "Страница N из M"; нічого, якщо все вміщається на одну сторінку"""
+    pages = (total + page_size - 1) // page_size
+    if pages > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        col1.button("←", key=f"{page_key}_prev", disabled=page == 0, on_click=on_turn_page, args=(page_key, -1))
+        col2.caption(f"Страница {page + 1} из {pages} · {label}: {total}")
+        col3.button("→", key=f"{page_key}_next", disabled=page >= pages - 1, on_click=on_turn_page, args=(page_key, 1))
+
+def on_difficulty_change(conn, front_code):
+    write_op(conn, 'pref', {'key': f"{front_code}_diff", 'value': str(st.session_state[f"diff_{front_code}"])})
+
+def front_progress(conn, front_code):
+    front = cached(('front', front_code), lambda: load_front(conn, front_code))
+    front_xp = front['xp']
+    front_level = front['level']
+    next_threshold = front['next_threshold']
+    current_threshold = front['current_threshold']
+    levelup_bonus = front['levelup_bonus']
+
     if next_threshold > current_threshold:
         progress = (front_xp - current_threshold) / (next_threshold - current_threshold) * 100
         progress = max(0, min(100, progress))
@@ -567,11 +1959,6 @@ def front_detail_page(conn, front_code):
     col1.metric("Уровень", front_level)
     col2.metric("XP", f"{front_xp:.0f}")
 
-    c.execute("SELECT xp_threshold FROM level_thresholds WHERE level=%s" if IS_CLOUD else
-              "SELECT xp_threshold FROM level_thresholds WHERE level=?", (front_level,))
-    levelup_bonus_row = c.fetchone()
-    levelup_bonus = levelup_bonus_row[0] if levelup_bonus_row else 100
-
     icon_html = get_nikocoin_icon()
     col_left, col_right = st.columns([4, 1])
     with col_left:
@@ -589,124 +1976,98 @@ def front_detail_page(conn, front_code):
         st.write(f"**→ Lvl {front_level + 1}**")
         st.markdown(f"*+{levelup_bonus:.0f} {icon_html}*", unsafe_allow_html=True)
 
-    st.divider()
+    today = datetime.now().strftime('%Y-%m-%d')
+    render_stats(cached(('stats', front_code, today), lambda: load_stats(conn, front_code, today)))
 
+def front_quick_log(conn, front_code):
     st.subheader("Быстрое логирование")
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Daily", "Weekly", "Sprint", "Campaign"])
-
-    last_diff = int(get_user_pref(conn, f"{front_code}_diff", "2"))
-
-    difficulty = st.slider("Сложность (влияет на XP: x0.5 до x3)", 1, 5, last_diff)
-    set_user_pref(conn, f"{front_code}_diff", str(difficulty))
-
-    for tier, tab in [("Daily", tab1), ("Weekly", tab2), ("Sprint", tab3), ("Campaign", tab4)]:
-        with tab:
-            c.execute("SELECT code, name, base_xp FROM piece_types WHERE front_code=%s AND tier=%s ORDER BY base_xp" if IS_CLOUD else
-                      "SELECT code, name, base_xp FROM piece_types WHERE front_code=? AND tier=? ORDER BY base_xp",
-                     (front_code, tier))
-            tasks = c.fetchall()
-
-            if not tasks:
-                st.info(f"Нет задач типа {tier}")
-                continue
-
-            for task_code, task_name, base_xp in tasks:
-                col1, col2, col3 = st.columns([3, 1, 1])
-                col1.write(f"**{task_name}** ({base_xp} XP)")
-                minutes = col2.number_input("Минуты", 0, 300, 0, 10, key=f"min_{task_code}", label_visibility="collapsed")
-
-                if col3.button("✓", key=f"do_{task_code}"):
-                    task = {
-                        'date': datetime.now().strftime('%Y-%m-%d'),
-                        'front_code': front_code,
-                        'tier': tier,
-                        'piece_type': task_code,
-                        'note': '',
-                        'minutes': minutes,
-                        'difficulty': difficulty,
-                        'status': 'Done'
-                    }
-
-                    old_overall_xp = c.execute("SELECT SUM(t.total_xp * f.weight) FROM tasks t JOIN fronts f ON t.front_code = f.code").fetchone()[0] or 0
-                    old_level = get_level(old_overall_xp, conn)
-
-                    total_xp = calc_task_xp(task, conn)
-                    coins = total_xp
-
-                    c.execute("""
-                        INSERT INTO tasks (date, front_code, tier, piece_type, note, minutes, difficulty, status, total_xp, coins_earned)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """ if IS_CLOUD else """
-                        INSERT INTO tasks (date, front_code, tier, piece_type, note, minutes, difficulty, status, total_xp, coins_earned)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (task['date'], task['front_code'], task['tier'], task['piece_type'],
-                          task['note'], task['minutes'], task['difficulty'], task['status'], total_xp, coins))
-
-                    conn.commit()
-
-                    new_overall_xp = c.execute("SELECT SUM(t.total_xp * f.weight) FROM tasks t JOIN fronts f ON t.front_code = f.code").fetchone()[0] or 0
-                    new_level = get_level(new_overall_xp, conn)
+    result = st.session_state.pop('quick_log_result', None)
+    if result == 'queued':
+        st.info("✓ Нет связи с базой - задача сохранена локально и будет записана позже")
+    elif result:
+        total_xp, coins, bonus = result
+        icon_html = get_nikocoin_icon()
+        if bonus > 0:
+            st.success(f"+{total_xp:.0f} XP | +{coins:.0f} {icon_html} | LEVEL UP! Бонус: +{bonus:.0f} {icon_html}!")
+            st.balloons()
+        else:
+            st.markdown(f"**✓** +{total_xp:.0f} XP | +{coins:.0f} {icon_html}", unsafe_allow_html=True)
+
+    # Збережені складність і обрані читаються з БД лише при першому показі фронту в сесії
+    diff_key = f"diff_{front_code}"
+    if diff_key not in st.session_state:
+        st.session_state[diff_key] = int(get_user_pref(conn, f"{front_code}_diff", "2") if conn else 2)
+    st.slider("Сложность (влияет на XP: x0.5 до x3)", 1, 5, key=diff_key,
+              on_change=on_difficulty_change, args=(conn, front_code))
+    st.text_input("Заметка к следующей задаче", key=f"note_{front_code}", placeholder="необязательно")
+
+    fav_key = f"favorites_{front_code}"
+    if fav_key not in st.session_state:
+        st.session_state[fav_key] = [code for code in (get_user_pref(conn, f"fav_{front_code}") if conn else '').split(',') if code]
+    favorites = st.session_state[fav_key]
+
+    if favorites:
+        st.caption("⭐ Избранное")
+        rows = cached(('piece_type_favorites', front_code, tuple(favorites)),
+                      lambda: load_favorite_piece_types(conn, front_code, favorites))
+        for row in rows:
+            piece_type_row(conn, front_code, row, True, show_tier=True)
+        st.divider()
 
-                    bonus = check_levelup_bonus(conn, old_level, new_level)
+    # Віджети створюються лише для видимої сторінки одного тиру або результатів пошуку
+    page_key = f"pt_page_{front_code}"
+    col1, col2 = st.columns([1, 2])
+    text = col1.text_input("Поиск задачи", key=f"pt_search_{front_code}", placeholder="название или код",
+                           on_change=on_reset_page, args=(page_key,))
+    tier = col2.radio("Тир", TIERS, key=f"pt_tier_{front_code}", horizontal=True, disabled=bool(text.strip()),
+                      on_change=on_reset_page, args=(page_key,))
+
+    page = st.session_state.setdefault(page_key, 0)
+    rows, total = cached(('piece_type_page', front_code, tier, text, tuple(favorites), page),
+                         lambda: load_piece_type_page(conn, front_code, tier, text, favorites, page))
+    if not rows and page:
+        # Каталог скоротився, поки користувач гортав
+        page = st.session_state[page_key] = 0
+        rows, total = cached(('piece_type_page', front_code, tier, text, tuple(favorites), page),
+                             lambda: load_piece_type_page(conn, front_code, tier, text, favorites, page))
+
+    if not rows:
+        st.info("Ничего не найдено" if text.strip() else f"Нет задач типа {tier}")
+        return
 
-                    icon_html = get_nikocoin_icon()
-                    if bonus > 0:
-                        st.success(f"+{total_xp:.0f} XP | +{coins:.0f} {icon_html} | LEVEL UP! Бонус: +{bonus:.0f} {icon_html}!")
-                        st.balloons()
-                    else:
-                        st.markdown(f"**✓** +{total_xp:.0f} XP | +{coins:.0f} {icon_html}", unsafe_allow_html=True)
+    for row in rows:
+        piece_type_row(conn, front_code, row, False, show_tier=bool(text.strip()))
 
-                    st.rerun()
+    render_pager(page_key, page, total, PIECE_TYPE_PAGE, "задач")
 
-    st.divider()
+def piece_type_row(conn, front_code, row, favorite, show_tier=False):
+    task_code, task_name, tier, base_xp = row
+    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+    col1.write(f"**{task_name}** ({base_xp} XP)" + (f" · {tier}" if show_tier else ""))
+    col2.number_input("Минуты", 0, 300, 0, 10, key=f"min_{task_code}", label_visibility="collapsed")
+    col3.button("✓", key=f"do_{task_code}", on_click=on_quick_log, args=(conn, front_code, tier, task_code))
+    col4.button("★" if favorite else "☆", key=f"fav_{task_code}", help="Закрепить наверху",
+                on_click=on_toggle_favorite, args=(conn, front_code, task_code))
 
+def front_charts(conn, front_code):
     st.subheader("Распределение XP по задачам")
-    c.execute("""
-        SELECT pt.name, SUM(t.total_xp) as total
-        FROM tasks t
-        JOIN piece_types pt ON t.piece_type = pt.code
-        WHERE t.front_code = %s
-        GROUP BY pt.code, pt.name
-        HAVING SUM(t.total_xp) > 0
-        ORDER BY total DESC
-    """ if IS_CLOUD else """
-        SELECT pt.name, SUM(t.total_xp) as total
-        FROM tasks t
-        JOIN piece_types pt ON t.piece_type = pt.code
-        WHERE t.front_code = ?
-        GROUP BY pt.code
-        HAVING total > 0
-        ORDER BY total DESC
-    """, (front_code,))
-
-    chart_data = c.fetchall()
-
-    if chart_data:
-        df = pd.DataFrame(chart_data, columns=['Задача', 'XP'])
+    df = cached(('front_pie', front_code), lambda: load_front_pie(conn, front_code))
+    if df is not None:
         fig = px.pie(df, values='XP', names='Задача', hole=0.3)
         st.plotly_chart(fig, use_container_width=True)
 
     st.divider()
 
+    st.subheader("Динамика")
+    render_timeline(conn, front_code)
+
+def front_history(conn, front_code):
     st.subheader("История")
-    c.execute("""
-        SELECT t.id, t.date, pt.name, t.status, t.total_xp
-        FROM tasks t
-        LEFT JOIN piece_types pt ON t.piece_type = pt.code
-        WHERE t.front_code = %s
-        ORDER BY t.date DESC, t.id DESC
-        LIMIT 20
-    """ if IS_CLOUD else """
-        SELECT t.id, t.date, pt.name, t.status, t.total_xp
-        FROM tasks t
-        LEFT JOIN piece_types pt ON t.piece_type = pt.code
-        WHERE t.front_code = ?
-        ORDER BY t.date DESC, t.id DESC
-        LIMIT 20
-    """, (front_code,))
+    history = cached(('front_history', front_code), lambda: load_front_history(conn, front_code))
 
-    history = c.fetchall()
+    if st.session_state.pop('delete_queued', False):
+        st.info("Нет связи с базой - задача будет удалена после восстановления связи")
     if history:
         for tid, tdate, tname, tstatus, txp in history:
             col1, col2, col3, col4, col5 = st.columns([2, 2, 1, 1, 1])
@@ -714,16 +2075,116 @@ def front_detail_page(conn, front_code):
             col2.write(tname)
             col3.write(tstatus)
             col4.write(f"{txp:.0f} XP")
-            if col5.button("🗑️", key=f"del_{tid}"):
-                c.execute("DELETE FROM tasks WHERE id=%s" if IS_CLOUD else "DELETE FROM tasks WHERE id=?", (tid,))
-                conn.commit()
-                st.rerun()
+            col5.button("🗑️", key=f"del_{tid}", on_click=on_delete_task, args=(conn, tid))
+
+@st.fragment
+def front_activity(conn, front_code):
+    """Усе, що змінюється від логування, в одному фрагменті: клік перемальовує лише його,
+    без повного прогону скрипта (init, сайдбар, інші сторінки)"""
+    try:
+        offline_section(front_progress, conn, front_code)
+        st.divider()
+        offline_section(front_quick_log, conn, front_code)
+        st.divider()
+        offline_section(front_charts, conn, front_code)
+        st.divider()
+        offline_section(front_history, conn, front_code)
+    except Exception as e:
+        if not db_unreachable(e):
+            raise
+        get_write_journal().went_offline(conn)
+        offline_notice()
+
+def front_detail_page(conn, front_code):
+    front = cached(('front', front_code), lambda: load_front(conn, front_code))
+    if not front:
+        st.error("Фронт не найден")
+        return
+
+    st.title(front['name'])
+    front_activity(conn, front_code)
+
+def load_reward_page(conn, text='', min_cost=0, max_cost=None, page=0):
+    """Сторінка товарів від дешевших до дорожчих з фільтрами за назвою і ціною:
+    ([(id, name, cost_coins, image_path)], скільки всього)"""
+    ph = '%s' if IS_CLOUD else '?'
+    where, params = [f"cost_coins >= {ph}"], [min_cost]
+    if max_cost is not None:
+        where.append(f"cost_coins <= {ph}")
+        params.append(max_cost)
+    search = prefix_search(conn, 'rewards', 'name', text)
+    if search:
+        where.append(search[0])
+        params.append(search[1])
+
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT id, name, cost_coins, image_path, COUNT(*) OVER ()
+        FROM rewards
+        WHERE {' AND '.join(where)}
+        ORDER BY cost_coins, id
+        LIMIT {ph} OFFSET {ph}
+    """, params + [SHOP_PAGE, page * SHOP_PAGE])
+    rows = c.fetchall()
+    return [row[:4] for row in rows], rows[0][4] if rows else 0
+
+def load_reward_options(conn, text=''):
+    """До SEARCH_LIMIT товарів для вибору в "Управлении": [(id, name, cost_coins)]"""
+    ph = '%s' if IS_CLOUD else '?'
+    search = prefix_search(conn, 'rewards', 'name', text)
+    c = conn.cursor()
+    c.execute(f"SELECT id, name, cost_coins FROM rewards {'WHERE ' + search[0] if search else ''} ORDER BY name, id LIMIT {ph}",
+              ([search[1]] if search else []) + [SEARCH_LIMIT])
+    return c.fetchall()
+
+def load_reward(conn, reward_id):
+    c = conn.cursor()
+    c.execute("SELECT id, name, cost_coins, image_path FROM rewards WHERE id=%s" if IS_CLOUD else
+              "SELECT id, name, cost_coins, image_path FROM rewards WHERE id=?", (reward_id,))
+    return c.fetchone()
+
+@st.cache_data(max_entries=THUMBNAIL_CACHE, show_spinner=False)
+def load_thumbnail(path, mtime_ns):
+    """PNG-мініатюра картинки товару; mtime_ns у ключі - заміна файлу дає нову мініатюру"""
+    with Image.open(path) as image:
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        # CMYK, палітра з прозорістю тощо в PNG як є не кодуються
+        thumb = image.convert('RGBA')
+    buf = io.BytesIO()
+    thumb.save(buf, format='PNG')
+    return buf.getvalue()
+
+def reward_thumbnail(path):
+    """Мініатюра лише для товарів видимої сторінки; None, якщо картинки немає або її не прочитати"""
+    if not path:
+        return None
+    try:
+        return load_thumbnail(str(path), Path(path).stat().st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, Image.DecompressionBombError):
+        log.warning("Не удалось сделать миниатюру %s", path, exc_info=True)
+        return None
+
+def load_purchase_history(conn):
+    """DataFrame останніх 50 покупок (None, якщо покупок немає)"""
+    c = conn.cursor()
+    c.execute("""
+        SELECT p.date, r.name, p.coins_spent
+        FROM purchases p
+        JOIN rewards r ON p.reward_id = r.id
+        ORDER BY p.id DESC
+        LIMIT 50
+    """)
+    purchases = c.fetchall()
+    if not purchases:
+        return None
+    return pd.DataFrame(purchases, columns=['Дата', 'Товар', 'Потрачено'])
 
 def shop_page(conn):
     st.title("🛒 Магазин")
 
-    c = conn.cursor()
-    total_coins = get_total_coins(conn)
+    total_coins = cached(('total_coins',), lambda: get_total_coins(conn))
 
     icon_html = get_nikocoin_icon()
     st.markdown(f"**Доступно:** {icon_html} {total_coins:.0f}", unsafe_allow_html=True)
@@ -733,119 +2194,256 @@ def shop_page(conn):
     tab1, tab2, tab3 = st.tabs(["Товары", "Управление", "История"])
 
     with tab1:
-        st.subheader("Доступные товары")
-        c.execute("SELECT id, name, cost_coins, image_path FROM rewards ORDER BY cost_coins")
-        rewards = c.fetchall()
+        offline_section(shop_catalog, conn, total_coins, icon_html)
 
-        if not rewards:
+    with tab2:
+        if conn is None:
+            st.info("Управление товарами доступно после восстановления связи с базой")
+        else:
+            shop_manage(conn, icon_html)
+
+    with tab3:
+        offline_section(shop_history, conn)
+
+def shop_history(conn):
+    st.subheader("История покупок")
+    df = cached(('purchase_history',), lambda: load_purchase_history(conn))
+
+    if df is not None:
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    else:
+        st.info("Покупок пока нет")
+
+def shop_catalog(conn, total_coins, icon_html):
+    """Товари сторінками: фільтри за назвою, ціною і балансом виконує БД, картинки - лише для видимих"""
+    st.subheader("Доступные товары")
+
+    page_key = 'shop_page'
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    text = col1.text_input("Название", key="shop_search", placeholder="поиск по названию",
+                           on_change=on_reset_page, args=(page_key,))
+    min_cost = col2.number_input("Цена от", 0, None, 0, 50, key="shop_min_cost",
+                                 on_change=on_reset_page, args=(page_key,))
+    max_cost = col3.number_input("Цена до", 0, None, 0, 50, key="shop_max_cost", help="0 - без ограничения",
+                                 on_change=on_reset_page, args=(page_key,))
+    affordable = col4.checkbox("По карману", key="shop_affordable", on_change=on_reset_page, args=(page_key,))
+
+    max_cost = max_cost or None
+    if affordable:
+        max_cost = total_coins if max_cost is None else min(max_cost, total_coins)
+
+    page = st.session_state.setdefault(page_key, 0)
+    rewards, total = cached(('reward_page', text, min_cost, max_cost, page),
+                            lambda: load_reward_page(conn, text, min_cost, max_cost, page))
+    if not rewards and page:
+        page = st.session_state[page_key] = 0
+        rewards, total = cached(('reward_page', text, min_cost, max_cost, page),
+                                lambda: load_reward_page(conn, text, min_cost, max_cost, page))
+
+    if not rewards:
+        if text.strip() or min_cost or max_cost is not None:
+            st.info("Ничего не найдено")
+        else:
             st.info("Магазин пуст. Добавьте товары во вкладке 'Управление'")
+        return
 
-        for rid, rname, rcost, rimg in rewards:
-            col1, col2, col3 = st.columns([2, 1, 1])
+    for rid, rname, rcost, rimg in rewards:
+        col1, col2, col3 = st.columns([2, 1, 1])
 
-            if rimg and Path(rimg).exists():
-                col1.image(str(rimg), width=100)
+        thumbnail = reward_thumbnail(rimg)
+        if thumbnail:
+            col1.image(thumbnail, width=100)
 
-            col1.write(f"**{rname}**")
-            col2.markdown(f"{rcost} {icon_html}", unsafe_allow_html=True)
+        col1.write(f"**{rname}**")
+        col2.markdown(f"{rcost} {icon_html}", unsafe_allow_html=True)
 
-            if col3.button("Купить", key=f"buy_{rid}", disabled=(total_coins < rcost)):
-                c.execute("INSERT INTO purchases (date, reward_id, coins_spent) VALUES (%s, %s, %s)" if IS_CLOUD else
-                          "INSERT INTO purchases (date, reward_id, coins_spent) VALUES (?, ?, ?)",
-                         (datetime.now().strftime('%Y-%m-%d'), rid, rcost))
-                conn.commit()
+        if col3.button("Купить", key=f"buy_{rid}", disabled=(total_coins < rcost)):
+            bought = write_op(conn, 'purchase', {'reward_id': rid, 'cost': rcost,
+                                                 'date': datetime.now().strftime('%Y-%m-%d')})
+            if bought is None:
+                st.info(f"Нет связи с базой - покупка «{rname}» будет проведена после восстановления связи, если хватит никоинов")
+            elif bought:
                 st.success(f"Куплено: {rname}")
                 st.balloons()
                 st.rerun()
+            else:
+                st.error("Недостаточно никоинов")
 
-    with tab2:
-        st.subheader("Управление товарами")
-
-        c.execute("SELECT id, name, cost_coins, image_path FROM rewards ORDER BY name")
-        rewards = c.fetchall()
-
-        for rid, rname, rcost, rimg in rewards:
-            with st.expander(f"{rname} ({rcost} {icon_html})"):
-                new_name = st.text_input("Название", rname, key=f"rname_{rid}")
-                new_cost = st.number_input(f"Цена ({icon_html})", 0, 100000, rcost, 50, key=f"rcost_{rid}")
-
-                uploaded_file = st.file_uploader("Загрузить картинку", type=['png', 'jpg', 'jpeg'], key=f"rimg_{rid}")
-                if uploaded_file:
-                    img_path = IMAGES_PATH / f"reward_{rid}_{uploaded_file.name}"
-                    with open(img_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    new_img = str(img_path)
-                    st.success(f"Картинка загружена: {img_path.name}")
-                else:
-                    new_img = rimg
-
-                if rimg and Path(rimg).exists():
-                    st.image(str(rimg), width=150, caption="Текущая картинка")
-
-                col1, col2 = st.columns(2)
-                if col1.button("Сохранить", key=f"rsave_{rid}"):
-                    c.execute("UPDATE rewards SET name=%s, cost_coins=%s, image_path=%s WHERE id=%s" if IS_CLOUD else
-                              "UPDATE rewards SET name=?, cost_coins=?, image_path=? WHERE id=?",
-                             (new_name, new_cost, new_img, rid))
-                    conn.commit()
-                    st.success("Обновлено")
-                    st.rerun()
-
-                if col2.button("Удалить", key=f"rdel_{rid}", type="secondary"):
-                    c.execute("DELETE FROM rewards WHERE id=%s" if IS_CLOUD else "DELETE FROM rewards WHERE id=?", (rid,))
-                    if rimg and Path(rimg).exists():
-                        Path(rimg).unlink()
-                    conn.commit()
-                    st.success("Удалено")
-                    st.rerun()
+    render_pager(page_key, page, total, SHOP_PAGE, "товаров")
 
-        st.divider()
-        st.subheader("Добавить товар")
-
-        new_name = st.text_input("Название товара")
-        new_cost = st.number_input(f"Цена ({icon_html})", 0, 100000, 100, 50)
-        new_img_file = st.file_uploader("Картинка (опционально)", type=['png', 'jpg', 'jpeg'])
-
-        if st.button("Создать товар"):
-            if new_name:
-                c.execute("INSERT INTO rewards (name, cost_coins, image_path) VALUES (%s, %s, %s) RETURNING id" if IS_CLOUD else
-                          "INSERT INTO rewards (name, cost_coins, image_path) VALUES (?, ?, ?)",
-                         (new_name, new_cost, None))
-
-                if IS_CLOUD:
-                    new_rid = c.fetchone()[0]
-                else:
-                    new_rid = c.lastrowid
-
-                conn.commit()
-
-                if new_img_file:
-                    img_path = IMAGES_PATH / f"reward_{new_rid}_{new_img_file.name}"
-                    with open(img_path, "wb") as f:
-                        f.write(new_img_file.getbuffer())
-                    c.execute("UPDATE rewards SET image_path=%s WHERE id=%s" if IS_CLOUD else
-                              "UPDATE rewards SET image_path=? WHERE id=?", (str(img_path), new_rid))
-                    conn.commit()
-
-                st.success("Товар создан")
-                st.rerun()
+def shop_manage(conn, icon_html):
+    """Одна форма для вибраного товару замість розгортки з завантажувачем на кожен товар"""
+    c = conn.cursor()
+    st.subheader("Управление товарами")
 
-    with tab3:
-        st.subheader("История покупок")
-        c.execute("""
-            SELECT p.date, r.name, p.coins_spent
-            FROM purchases p
-            JOIN rewards r ON p.reward_id = r.id
-            ORDER BY p.id DESC
-            LIMIT 50
-        """)
-        purchases = c.fetchall()
+    text = st.text_input("Найти товар", key="shop_manage_search", placeholder="начало названия")
+    options = cached(('reward_options', text), lambda: load_reward_options(conn, text))
 
-        if purchases:
-            df = pd.DataFrame(purchases, columns=['Дата', 'Товар', 'Потрачено'])
-            st.dataframe(df, use_container_width=True, hide_index=True)
+    if options:
+        labels = {rid: f"{rname} ({rcost})" for rid, rname, rcost in options}
+        rid = st.selectbox("Товар", list(labels), format_func=labels.get, key="shop_manage_reward")
+        if len(options) >= SEARCH_LIMIT:
+            st.caption(f"Показаны первые {SEARCH_LIMIT} - уточните поиск")
+        reward = cached(('reward', rid), lambda: load_reward(conn, rid))
+    else:
+        reward = None
+        if text.strip():
+            st.info("Ничего не найдено")
+
+    if reward:
+        rid, rname, rcost, rimg = reward
+        new_name = st.text_input("Название", rname, key=f"rname_{rid}")
+        new_cost = st.number_input(f"Цена ({icon_html})", 0, 100000, rcost, 50, key=f"rcost_{rid}")
+
+        uploaded_file = st.file_uploader("Загрузить картинку", type=['png', 'jpg', 'jpeg'], key=f"rimg_{rid}")
+        if uploaded_file:
+            img_path = IMAGES_PATH / f"reward_{rid}_{uploaded_file.name}"
+            with open(img_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            new_img = str(img_path)
+            st.success(f"Картинка загружена: {img_path.name}")
         else:
-            st.info("Покупок пока нет")
+            new_img = rimg
+
+        thumbnail = reward_thumbnail(rimg)
+        if thumbnail:
+            st.image(thumbnail, width=150, caption="Текущая картинка")
+
+        col1, col2 = st.columns(2)
+        if col1.button("Сохранить", key=f"rsave_{rid}"):
+            c.execute("UPDATE rewards SET name=%s, cost_coins=%s, image_path=%s WHERE id=%s" if IS_CLOUD else
+                      "UPDATE rewards SET name=?, cost_coins=?, image_path=? WHERE id=?",
+                     (new_name, new_cost, new_img, rid))
+            commit(conn)
+            st.success("Обновлено")
+            st.rerun()
+
+        if col2.button("Удалить", key=f"rdel_{rid}", type="secondary"):
+            c.execute("DELETE FROM rewards WHERE id=%s" if IS_CLOUD else "DELETE FROM rewards WHERE id=?", (rid,))
+            if rimg and Path(rimg).exists():
+                Path(rimg).unlink()
+            commit(conn)
+            st.success("Удалено")
+            st.rerun()
+
+    st.divider()
+    st.subheader("Добавить товар")
+
+    new_name = st.text_input("Название товара")
+    new_cost = st.number_input(f"Цена ({icon_html})", 0, 100000, 100, 50)
+    new_img_file = st.file_uploader("Картинка (опционально)", type=['png', 'jpg', 'jpeg'])
+
+    if st.button("Создать товар"):
+        if new_name:
+            c.execute("INSERT INTO rewards (name, cost_coins, image_path) VALUES (%s, %s, %s) RETURNING id" if IS_CLOUD else
+                      "INSERT INTO rewards (name, cost_coins, image_path) VALUES (?, ?, ?)",
+                     (new_name, new_cost, None))
+
+            if IS_CLOUD:
+                new_rid = c.fetchone()[0]
+            else:
+                new_rid = c.lastrowid
+
+            commit(conn)
+
+            if new_img_file:
+                img_path = IMAGES_PATH / f"reward_{new_rid}_{new_img_file.name}"
+                with open(img_path, "wb") as f:
+                    f.write(new_img_file.getbuffer())
+                c.execute("UPDATE rewards SET image_path=%s WHERE id=%s" if IS_CLOUD else
+                          "UPDATE rewards SET image_path=? WHERE id=?", (str(img_path), new_rid))
+                commit(conn)
+
+            st.success("Товар создан")
+            st.rerun()
+
+MULTIPLIER_COLUMNS = ['tier_daily', 'tier_weekly', 'tier_sprint', 'tier_campaign',
+                      'diff_1', 'diff_2', 'diff_3', 'diff_4', 'diff_5']
+PIECE_TYPE_COLUMNS = ['code', 'name', 'tier', 'base_xp']
+# Порушення унікальності чи зовнішнього ключа при збереженні таблиць налаштувань
+INTEGRITY_ERRORS = (sqlite3.IntegrityError, psycopg2.IntegrityError) if IS_CLOUD else (sqlite3.IntegrityError,)
+
+def load_multipliers_frame(conn):
+    c = conn.cursor()
+    c.execute(f"SELECT code, name, {', '.join(MULTIPLIER_COLUMNS)} FROM fronts ORDER BY name")
+    return pd.DataFrame(c.fetchall(), columns=['code', 'name'] + MULTIPLIER_COLUMNS)
+
+def load_piece_types_frame(conn, front_code):
+    """Усі типи задач фронту одним запитом"""
+    c = conn.cursor()
+    c.execute("SELECT id, code, name, tier, base_xp FROM piece_types WHERE front_code=%s ORDER BY tier, base_xp" if IS_CLOUD else
+              "SELECT id, code, name, tier, base_xp FROM piece_types WHERE front_code=? ORDER BY tier, base_xp", (front_code,))
+    return pd.DataFrame(c.fetchall(), columns=['id'] + PIECE_TYPE_COLUMNS)
+
+def to_db_value(value):
+    """numpy/pandas скаляр -> звичайний Python-тип, NaN -> None"""
+    if value is None or (isinstance(value, float) and value != value) or value is pd.NA:
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+def diff_frames(original, edited, key, columns):
+    """Різниця між вихідною і відредагованою в st.data_editor таблицею: (inserts, updates, deletes)
+
+    Нові рядки - ті, в яких ще немає ключа; видалені - ключі, яких більше немає у відредагованій таблиці."""
+    def rows(frame):
+        return [tuple(to_db_value(v) for v in row) for row in frame[columns].itertuples(index=False)]
+
+    added = edited[edited[key].isna()]
+    kept = edited[edited[key].notna()]
+    before = dict(zip((to_db_value(k) for k in original[key]), rows(original)))
+    after = dict(zip((to_db_value(k) for k in kept[key]), rows(kept)))
+
+    inserts = rows(added)
+    updates = [(k, values) for k, values in after.items() if before.get(k) != values]
+    deletes = [k for k in before if k not in after]
+    return inserts, updates, deletes
+
+def save_table_diff(conn, table, key, columns, inserts=(), updates=(), deletes=(), extra=None):
+    """Застосовує вставки, оновлення й видалення батчами в одній транзакції"""
+    ph = '%s' if IS_CLOUD else '?'
+    extra = extra or {}
+    c = conn.cursor()
+    try:
+        if deletes:
+            c.executemany(f"DELETE FROM {table} WHERE {key}={ph}", [(k,) for k in deletes])
+        if updates:
+            c.executemany(f"UPDATE {table} SET {', '.join(f'{col}={ph}' for col in columns)} WHERE {key}={ph}",
+                          [values + (k,) for k, values in updates])
+        if inserts:
+            insert_columns = list(extra) + columns
+            c.executemany(f"INSERT INTO {table} ({', '.join(insert_columns)}) VALUES ({', '.join([ph] * len(insert_columns))})",
+                          [tuple(extra.values()) + values for values in inserts])
+        commit(conn)
+    except Exception:
+        conn.rollback()
+        raise
+
+def search_page(conn):
+    st.title("🔎 Поиск")
+
+    text = st.text_input("Что искать", placeholder="Заметка или название задачи")
+    fronts = {"Все фронты": None}
+    fronts.update({fname: fcode for fcode, fname in cached(('front_list',), lambda: load_front_list(conn))})
+    col1, col2 = st.columns(2)
+    front_code = fronts[col1.selectbox("Фронт", list(fronts))]
+    period = col2.date_input("Период", value=(), format="YYYY-MM-DD")
+
+    date_from = period[0].strftime('%Y-%m-%d') if len(period) > 0 else None
+    date_to = period[1].strftime('%Y-%m-%d') if len(period) > 1 else None
+
+    if not text.strip():
+        st.info("Введите слово или начало слова")
+        return
+
+    results = cached(('search', text, front_code, date_from, date_to),
+                     lambda: search_tasks(conn, text, front_code, date_from, date_to))
+    if not results:
+        st.info("Ничего не найдено")
+        return
+
+    st.caption(f"Найдено: {len(results)}" + (" (показаны лучшие)" if len(results) >= SEARCH_LIMIT else ""))
+    for tid, tdate, fname, pname, tstatus, txp, snippet in results:
+        st.markdown(f"**{tdate}** · {fname or '—'} · {pname} · {tstatus} · {txp:.0f} XP  \n{snippet}")
 
 def settings_page(conn):
     st.title("Настройки")
@@ -896,140 +2494,200 @@ def settings_page(conn):
         c.execute("UPDATE fronts SET name=%s, coef=%s, weight=%s WHERE code=%s" if IS_CLOUD else
                   "UPDATE fronts SET name=?, coef=?, weight=? WHERE code=?",
                  (new_fname, new_fcoef, new_fweight, front_code))
-        conn.commit()
+        commit(conn)
         st.success("Обновлено")
 
     if st.button("Удалить фронт", type="secondary"):
         c.execute("DELETE FROM fronts WHERE code=%s" if IS_CLOUD else "DELETE FROM fronts WHERE code=?", (front_code,))
         c.execute("DELETE FROM piece_types WHERE front_code=%s" if IS_CLOUD else "DELETE FROM piece_types WHERE front_code=?", (front_code,))
         c.execute("DELETE FROM tasks WHERE front_code=%s" if IS_CLOUD else "DELETE FROM tasks WHERE front_code=?", (front_code,))
-        conn.commit()
+        c.execute("DELETE FROM task_rollups WHERE front_code=%s" if IS_CLOUD else "DELETE FROM task_rollups WHERE front_code=?", (front_code,))
+        commit(conn)
+        rebuild_stats(conn)
         st.success("Фронт удалён")
         st.rerun()
 
+    if st.button("Пересчитать статистику серий"):
+        rebuild_stats(conn)
+        st.success("Статистика пересчитана")
+
     st.divider()
 
-    st.subheader("Множители")
-    c.execute("""SELECT tier_daily, tier_weekly, tier_sprint, tier_campaign, 
-                 diff_1, diff_2, diff_3, diff_4, diff_5 FROM fronts WHERE code=%s""" if IS_CLOUD else
-              """SELECT tier_daily, tier_weekly, tier_sprint, tier_campaign, 
-                 diff_1, diff_2, diff_3, diff_4, diff_5 FROM fronts WHERE code=?""", (front_code,))
-    row = c.fetchone()
-
-    st.write("**Тиры:**")
-    col1, col2, col3, col4 = st.columns(4)
-    t_daily = col1.number_input("Daily", 0.1, 5.0, row[0], 0.1)
-    t_weekly = col2.number_input("Weekly", 0.1, 5.0, row[1], 0.1)
-    t_sprint = col3.number_input("Sprint", 0.1, 5.0, row[2], 0.1)
-    t_campaign = col4.number_input("Campaign", 0.1, 5.0, row[3], 0.1)
-
-    st.write("**Сложность:**")
-    col1, col2, col3, col4, col5 = st.columns(5)
-    d1 = col1.number_input("1", 0.1, 5.0, row[4], 0.1)
-    d2 = col2.number_input("2", 0.1, 5.0, row[5], 0.1)
-    d3 = col3.number_input("3", 0.1, 5.0, row[6], 0.1)
-    d4 = col4.number_input("4", 0.1, 5.0, row[7], 0.1)
-    d5 = col5.number_input("5", 0.1, 5.0, row[8], 0.1)
+    st.subheader("Множители фронтов")
+    multipliers = load_multipliers_frame(conn)
+    edited = st.data_editor(
+        multipliers, key="multipliers_editor", hide_index=True, use_container_width=True,
+        disabled=['name'],
+        column_config={
+            'code': None,
+            'name': st.column_config.TextColumn("Фронт"),
+            **{col: st.column_config.NumberColumn(col, min_value=0.1, max_value=5.0, step=0.1, required=True)
+               for col in MULTIPLIER_COLUMNS},
+        })
 
     if st.button("Сохранить множители"):
-        c.execute("""UPDATE fronts SET tier_daily=%s, tier_weekly=%s, tier_sprint=%s, tier_campaign=%s,
-                     diff_1=%s, diff_2=%s, diff_3=%s, diff_4=%s, diff_5=%s WHERE code=%s""" if IS_CLOUD else
-                  """UPDATE fronts SET tier_daily=?, tier_weekly=?, tier_sprint=?, tier_campaign=?,
-                     diff_1=?, diff_2=?, diff_3=?, diff_4=?, diff_5=? WHERE code=?""",
-                 (t_daily, t_weekly, t_sprint, t_campaign, d1, d2, d3, d4, d5, front_code))
-        conn.commit()
-        st.success("Множители обновлены")
+        _, updates, _ = diff_frames(multipliers, edited, 'code', MULTIPLIER_COLUMNS)
+        save_table_diff(conn, 'fronts', 'code', MULTIPLIER_COLUMNS, updates=updates)
+        del st.session_state["multipliers_editor"]
+        st.success(f"Множители обновлены: {len(updates)}")
+        st.rerun()
 
     st.divider()
 
     st.subheader("Задачи")
-
-    for tier in ['Daily', 'Weekly', 'Sprint', 'Campaign']:
-        with st.expander(f"{tier} задачи"):
-            c.execute("SELECT code, name, base_xp FROM piece_types WHERE front_code=%s AND tier=%s ORDER BY name" if IS_CLOUD else
-                      "SELECT code, name, base_xp FROM piece_types WHERE front_code=? AND tier=? ORDER BY name",
-                     (front_code, tier))
-            tasks = c.fetchall()
-
-            for tcode, tname, txp in tasks:
-                col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
-                col1.write(f"**{tname}**")
-                new_xp = col2.number_input("XP", 0, 10000, int(txp), 10, key=f"xp_{tcode}", label_visibility="collapsed")
-
-                if col3.button("💾", key=f"save_{tcode}"):
-                    c.execute("UPDATE piece_types SET base_xp=%s WHERE code=%s" if IS_CLOUD else
-                              "UPDATE piece_types SET base_xp=? WHERE code=?", (new_xp, tcode))
-                    conn.commit()
-                    st.success("✓")
-
-                if col4.button("🗑️", key=f"del_{tcode}"):
-                    c.execute("DELETE FROM piece_types WHERE code=%s" if IS_CLOUD else
-                              "DELETE FROM piece_types WHERE code=?", (tcode,))
-                    conn.commit()
-                    st.rerun()
-
-            st.write("**Добавить задачу:**")
-            col1, col2, col3 = st.columns(3)
-            new_code = col1.text_input("Код", "", key=f"newcode_{tier}")
-            new_name = col2.text_input("Название", "", key=f"newname_{tier}")
-            new_xp = col3.number_input("XP", 0, 10000, 10, 10, key=f"newxp_{tier}")
-
-            if st.button("Создать", key=f"create_{tier}"):
-                if new_code and new_name:
-                    try:
-                        c.execute("INSERT INTO piece_types (front_code, code, name, tier, base_xp) VALUES (%s, %s, %s, %s, %s)" if IS_CLOUD else
-                                  "INSERT INTO piece_types (front_code, code, name, tier, base_xp) VALUES (?, ?, ?, ?, ?)",
-                                 (front_code, new_code, new_name, tier, new_xp))
-                        conn.commit()
-                        st.success("Создано")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Код уже существует: {e}")
+    editor_key = f"piece_types_editor_{front_code}"
+    pieces = load_piece_types_frame(conn, front_code)
+    edited = st.data_editor(
+        pieces, key=editor_key, num_rows="dynamic", hide_index=True, use_container_width=True,
+        column_config={
+            'id': None,
+            'code': st.column_config.TextColumn("Код", required=True),
+            'name': st.column_config.TextColumn("Название", required=True),
+            'tier': st.column_config.SelectboxColumn("Тир", options=TIERS, required=True),
+            'base_xp': st.column_config.NumberColumn("XP", min_value=0, max_value=10000, step=10, required=True),
+        })
+
+    if st.button("Сохранить задачи"):
+        inserts, updates, deletes = diff_frames(pieces, edited, 'id', PIECE_TYPE_COLUMNS)
+        codes = dict(zip(pieces['id'], pieces['code']))
+        incomplete = [row for row in inserts + [values for _, values in updates]
+                      if any(v is None or v == '' for v in row) or row[2] not in TIERS]
+        if incomplete:
+            st.error("Заполните код, название, тир и XP во всех строках")
+        elif any(values[0] != codes[pid] for pid, values in updates):
+            st.error("Код существующей задачи менять нельзя - на него ссылается история")
+        else:
+            try:
+                save_table_diff(conn, 'piece_types', 'id', PIECE_TYPE_COLUMNS,
+                                inserts=inserts, updates=updates, deletes=deletes,
+                                extra={'front_code': front_code})
+            except INTEGRITY_ERRORS as e:
+                st.error(f"Не удалось сохранить (код уже существует?): {e}")
+            else:
+                del st.session_state[editor_key]
+                st.success(f"Сохранено: +{len(inserts)} / ~{len(updates)} / -{len(deletes)}")
+                st.rerun()
 
 # ============= MAIN APP =============
-st.set_page_config(page_title="Life Gamification", layout="wide", initial_sidebar_state="expanded")
-
-conn = init_database()
-seed_data(conn)
-
-if 'active_front' not in st.session_state:
-    st.session_state['active_front'] = None
-if 'active_page' not in st.session_state:
-    st.session_state['active_page'] = 'dashboard'
-
-st.sidebar.title("Life Gamification")
-
-if st.sidebar.button("🏠 Дашборд", use_container_width=True):
-    st.session_state['active_page'] = 'dashboard'
-    st.session_state['active_front'] = None
-    st.rerun()
-
-if st.sidebar.button("⚙️ Настройки", use_container_width=True):
-    st.session_state['active_page'] = 'settings'
-    st.session_state['active_front'] = None
-    st.rerun()
-
-if st.sidebar.button("🛒 Магазин", use_container_width=True):
-    st.session_state['active_page'] = 'shop'
-    st.session_state['active_front'] = None
-    st.rerun()
-
-st.sidebar.divider()
-st.sidebar.subheader("Фронты")
-
-c = conn.cursor()
-c.execute("SELECT code, name FROM fronts ORDER BY name")
-for fcode, fname in c.fetchall():
-    if st.sidebar.button(fname, key=f"nav_{fcode}", use_container_width=True):
-        st.session_state['active_front'] = fcode
-        st.session_state['active_page'] = 'front'
+@st.cache_resource
+def prepare_database():
+    """Схема і стартові дані - один раз на процес, а не на кожен прогін скрипта"""
+    conn = init_database()
+    seed_data(conn)
+    # Статистика з'явилася пізніше за історію задач - збираємо її один раз повністю
+    c = conn.cursor()
+    c.execute("SELECT EXISTS (SELECT 1 FROM task_totals), EXISTS (SELECT 1 FROM stats_tally)")
+    has_tasks, has_stats = c.fetchone()
+    if has_tasks and not has_stats:
+        rebuild_stats(conn)
+    prune_applied_ops(conn)
+    conn.close()
+
+def connect():
+    """З'єднання для прогону сторінки з обмеженим очікуванням; None, якщо БД зараз недоступна.
+    Заодно доносить записи, що накопичилися в журналі"""
+    journal = get_write_journal()
+    if not journal.online():
+        return None
+    conn = None
+    try:
+        prepare_database()
+        conn = get_connection(DB_STATEMENT_TIMEOUT)
+        external = check_data_version(conn)
+        if READ_MIRROR:
+            mirror = get_read_mirror()
+            if external:
+                mirror.synced_at = 0
+            mirror.refresh(conn)
+            conn = MirroredConnection(conn, mirror)
+        if journal.ops:
+            try:
+                replayed = journal.replay(conn)
+                if replayed:
+                    st.toast(f"Связь восстановлена, записано отложенных действий: {replayed}")
+            except Exception as e:
+                # БД зайнята іншим записом: відкладене лишається в журналі до наступного прогону
+                if not db_busy(e):
+                    raise
+                conn.rollback()
+        return conn
+    except Exception as e:
+        if not db_unreachable(e):
+            raise
+        journal.went_offline(conn)
+        return None
+
+def main():
+    st.set_page_config(page_title="Life Gamification", layout="wide", initial_sidebar_state="expanded")
+
+    conn = connect()
+    # Фрагменти перезапускаються з тим самим conn - і з тим самим режимом кешу
+    st.session_state['offline'] = conn is None
+
+    if 'active_front' not in st.session_state:
+        st.session_state['active_front'] = None
+    if 'active_page' not in st.session_state:
+        st.session_state['active_page'] = 'dashboard'
+
+    st.sidebar.title("Life Gamification")
+
+    if st.sidebar.button("🏠 Дашборд", use_container_width=True):
+        st.session_state['active_page'] = 'dashboard'
+        st.session_state['active_front'] = None
+        st.rerun()
+
+    if st.sidebar.button("⚙️ Настройки", use_container_width=True):
+        st.session_state['active_page'] = 'settings'
+        st.session_state['active_front'] = None
+        st.rerun()
+
+    if st.sidebar.button("🛒 Магазин", use_container_width=True):
+        st.session_state['active_page'] = 'shop'
+        st.session_state['active_front'] = None
+        st.rerun()
+
+    if st.sidebar.button("🔎 Поиск", use_container_width=True):
+        st.session_state['active_page'] = 'search'
+        st.session_state['active_front'] = None
         st.rerun()
 
-if st.session_state['active_front'] and st.session_state['active_page'] == 'front':
-    front_detail_page(conn, st.session_state['active_front'])
-elif st.session_state['active_page'] == 'dashboard':
-    dashboard_page(conn)
-elif st.session_state['active_page'] == 'settings':
-    settings_page(conn)
-elif st.session_state['active_page'] == 'shop':
-    shop_page(conn)
\ No newline at end of file
+    if conn is None:
+        # Сторінки малюються з останніх відомих даних, записи йдуть у журнал
+        offline_notice()
+
+    try:
+        render_pages(conn)
+    except OfflineMiss:
+        st.info("Эта страница появится после восстановления связи с базой")
+    except Exception as e:
+        if not db_unreachable(e):
+            raise
+        # Зв'язок обірвався посеред сторінки: те, що встигло відрендеритися, лишається, записи - в журналі
+        get_write_journal().went_offline(conn)
+        offline_notice()
+
+def render_pages(conn):
+    st.sidebar.divider()
+    st.sidebar.subheader("Фронты")
+
+    for fcode, fname in cached(('front_list',), lambda: load_front_list(conn)):
+        if st.sidebar.button(fname, key=f"nav_{fcode}", use_container_width=True):
+            st.session_state['active_front'] = fcode
+            st.session_state['active_page'] = 'front'
+            st.rerun()
+
+    if conn is None and st.session_state['active_page'] in ('settings', 'search'):
+        st.info("Без связи с базой доступны дашборд, фронты и магазин")
+    elif st.session_state['active_front'] and st.session_state['active_page'] == 'front':
+        front_detail_page(conn, st.session_state['active_front'])
+    elif st.session_state['active_page'] == 'dashboard':
+        dashboard_page(conn)
+    elif st.session_state['active_page'] == 'settings':
+        settings_page(conn)
+    elif st.session_state['active_page'] == 'shop':
+        shop_page(conn)
+    elif st.session_state['active_page'] == 'search':
+        search_page(conn)
+
+if __name__ == "__main__":
+    main()
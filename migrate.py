@@ -0,0 +1,225 @@
+"""
+Life Gamification - перенесення локальної SQLite-бази в PostgreSQL
+Запуск: python migrate.py --pg-url URL [--sqlite PATH] [--chunk N] [--replace] [--restart]
+Застосунок на час перенесення варто зупинити; перерваний запуск продовжується з місця зупинки.
+"""
+
+import argparse
+import io
+import math
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+
+import main
+from backup import ordered_tables
+
+CHUNK = 50000
+# Відносна похибка контрольних сум: REAL у PostgreSQL - 4-байтовий float
+FLOAT_TOLERANCE = 1e-6
+NUMERIC_TYPES = ('smallint', 'integer', 'bigint', 'real', 'double precision', 'numeric')
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+DELETED_REWARD = 'Удалённый товар'
+
+def copy_value(value):
+    """Значення SQLite у текстовому форматі COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    if isinstance(value, bytes):
+        return '\\\\x' + value.hex()
+    # Динамічна типізація SQLite: 10.0 в INTEGER-колонці PostgreSQL прийме лише як 10
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2 ** 63:
+        return str(int(value))
+    return str(value)
+
+def sqlite_columns(lite, table):
+    return [row[1] for row in lite.execute(f"PRAGMA table_info({table})")]
+
+def pg_columns(c, table):
+    """{колонка: тип} таблиці в PostgreSQL"""
+    c.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_schema='public' AND table_name=%s",
+              (table,))
+    return dict(c.fetchall())
+
+def migration_plan(lite, pg):
+    """[(таблиця, спільні колонки, типи в PostgreSQL)] у порядку зовнішніх ключів.
+    Службові таблиці (FTS-індекс SQLite, search_vector PostgreSQL) кожна база веде сама"""
+    sqlite_tables = {row[0] for row in lite.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")}
+    c = pg.cursor()
+    plan = []
+    for table in ordered_tables(c):
+        if table not in sqlite_tables or table == 'migrate_checkpoint':
+            continue
+        types = pg_columns(c, table)
+        columns = [col for col in sqlite_columns(lite, table) if col in types]
+        plan.append((table, columns, types))
+    return plan
+
+def prepare_target(lite, pg, plan, replace=False, restart=False):
+    """Чекпоінти в PostgreSQL; перший запуск починає з порожніх таблиць"""
+    c = pg.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS migrate_checkpoint (
+        table_name TEXT PRIMARY KEY,
+        last_rowid BIGINT NOT NULL DEFAULT 0,
+        rows BIGINT NOT NULL DEFAULT 0,
+        done BOOLEAN NOT NULL DEFAULT FALSE
+    )''')
+    if restart:
+        c.execute("DELETE FROM migrate_checkpoint")
+    c.execute("SELECT COUNT(*) FROM migrate_checkpoint")
+    if c.fetchone()[0] == 0:
+        tables = [table for table, _, _ in plan]
+        c.execute(f"SELECT {' + '.join(f'(SELECT COUNT(*) FROM {table})' for table in tables)}")
+        if c.fetchone()[0] and not replace:
+            pg.rollback()
+            sys.exit("В PostgreSQL уже есть данные - запустите с --replace, чтобы заменить их")
+        c.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY")
+        c.executemany("INSERT INTO migrate_checkpoint (table_name) VALUES (%s)", [(table,) for table in tables])
+
+    # Вектор пошуку рахуємо одним проходом наприкінці, а не тригером на кожен рядок COPY
+    c.execute("ALTER TABLE tasks DISABLE TRIGGER tasks_search_vector")
+    pg.commit()
+
+def restore_deleted_rewards(lite, pg):
+    """SQLite не перевіряє зовнішні ключі: покупки видалених товарів отримують товар-заглушку з тим самим id"""
+    missing = [row[0] for row in lite.execute(
+        "SELECT DISTINCT reward_id FROM purchases WHERE reward_id NOT IN (SELECT id FROM rewards)")]
+    if missing:
+        c = pg.cursor()
+        c.executemany("INSERT INTO rewards (id, name, cost_coins) VALUES (%s, %s, 0) ON CONFLICT (id) DO NOTHING",
+                      [(rid, DELETED_REWARD) for rid in missing])
+        pg.commit()
+    return len(missing)
+
+def copy_table(lite, pg, table, columns, chunk=CHUNK):
+    """Переносить таблицю порціями по rowid; кожна порція комітиться разом з чекпоінтом"""
+    c = pg.cursor()
+    c.execute("SELECT last_rowid, rows, done FROM migrate_checkpoint WHERE table_name=%s", (table,))
+    last_rowid, rows, done = c.fetchone()
+    if done:
+        return rows
+
+    names = ', '.join(columns)
+    while True:
+        batch = lite.execute(f"SELECT rowid, {names} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                             (last_rowid, chunk)).fetchall()
+        if batch:
+            buf = io.StringIO()
+            for row in batch:
+                buf.write('\t'.join(copy_value(value) for value in row[1:]))
+                buf.write('\n')
+            buf.seek(0)
+            c.copy_expert(f"COPY {table} ({names}) FROM STDIN", buf)
+            last_rowid = batch[-1][0]
+            rows += len(batch)
+        finished = len(batch) < chunk
+        c.execute("UPDATE migrate_checkpoint SET last_rowid=%s, rows=%s, done=%s WHERE table_name=%s",
+                  (last_rowid, rows, finished, table))
+        pg.commit()
+        print(f"  {table}: {rows}", end='\r', flush=True)
+        if finished:
+            print()
+            return rows
+
+def finish_target(pg, plan, chunk=CHUNK):
+    """Лічильники SERIAL після явних id, вектор пошуку для перенесених задач, тригер назад"""
+    c = pg.cursor()
+    for table, _, _ in plan:
+        c.execute("""SELECT column_name FROM information_schema.columns
+                     WHERE table_schema='public' AND table_name=%s AND column_default LIKE 'nextval(%%'""", (table,))
+        for (column,) in c.fetchall():
+            c.execute(f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)",
+                      (table, column))
+    pg.commit()
+
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM tasks")
+    max_id = c.fetchone()[0]
+    for start in range(0, max_id, chunk):
+        c.execute('''UPDATE tasks t SET search_vector = to_tsvector('simple', COALESCE(t.note, '') || ' ' ||
+                         COALESCE((SELECT name FROM piece_types WHERE code = t.piece_type), t.piece_type))
+                     WHERE t.id > %s AND t.id <= %s AND t.search_vector IS NULL''', (start, start + chunk))
+        pg.commit()
+    c.execute("ALTER TABLE tasks ENABLE TRIGGER tasks_search_vector")
+    # База старішої версії без coin_balance: баланс рахуємо з перенесеної історії
+    if 'coin_balance' not in [table for table, _, _ in plan]:
+        c.execute(f"UPDATE coin_balance SET coins = {main.BALANCE_SQL} WHERE id = 1")
+    pg.commit()
+
+def checksums(execute, table, columns, types, sqlite_side):
+    """Кількість рядків + сума кожної числової колонки + сумарна довжина текстових"""
+    parts = ['COUNT(*)']
+    for col in columns:
+        if types[col] in NUMERIC_TYPES:
+            # SUM(real) у PostgreSQL накопичує в float4 - рахуємо в double
+            parts.append(f"SUM({col})" if sqlite_side else f"SUM(CAST({col} AS DOUBLE PRECISION))")
+        elif types[col] == 'text':
+            parts.append(f"SUM(LENGTH({col}))")
+    where = f" WHERE name <> '{DELETED_REWARD}' OR cost_coins <> 0" if table == 'rewards' and not sqlite_side else ''
+    return execute(f"SELECT {', '.join(parts)} FROM {table}{where}")
+
+def same(a, b):
+    if a is None or b is None:
+        return (a or 0) == (b or 0)
+    return math.isclose(float(a), float(b), rel_tol=FLOAT_TOLERANCE, abs_tol=FLOAT_TOLERANCE)
+
+def verify(lite, pg, plan):
+    """Порівнює контрольні суми всіх таблиць; повертає список розбіжностей"""
+    c = pg.cursor()
+
+    def pg_execute(query):
+        c.execute(query)
+        return c.fetchone()
+
+    problems = []
+    for table, columns, types in plan:
+        expected = checksums(lambda q: lite.execute(q).fetchone(), table, columns, types, True)
+        actual = checksums(pg_execute, table, columns, types, False)
+        if not all(same(a, b) for a, b in zip(expected, actual)):
+            problems.append((table, expected, actual))
+    pg.rollback()
+    return problems
+
+def migrate(sqlite_path, pg_url, chunk=CHUNK, replace=False, restart=False):
+    started = time.time()
+    lite = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    pg = psycopg2.connect(pg_url)
+    main.init_postgres_schema(pg)
+
+    plan = migration_plan(lite, pg)
+    prepare_target(lite, pg, plan, replace, restart)
+    total = 0
+    for table, columns, _ in plan:
+        if table == 'purchases':
+            restored = restore_deleted_rewards(lite, pg)
+            if restored:
+                print(f"  rewards: +{restored} заглушек для удалённых товаров")
+        total += copy_table(lite, pg, table, columns, chunk)
+    finish_target(pg, plan, chunk)
+
+    problems = verify(lite, pg, plan)
+    for table, expected, actual in problems:
+        print(f"Расхождение в {table}: SQLite {expected} / PostgreSQL {actual}")
+    if not problems:
+        print(f"Перенесено строк: {total} за {time.time() - started:.0f} с, контрольные суммы совпадают")
+        c = pg.cursor()
+        c.execute("DROP TABLE migrate_checkpoint")
+        pg.commit()
+    lite.close()
+    pg.close()
+    return not problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос локальной базы Life Gamification в PostgreSQL")
+    parser.add_argument('--pg-url', required=True, help="строка подключения PostgreSQL")
+    parser.add_argument('--sqlite', type=Path, default=Path.home() / ".gamify" / "xp.db", help="путь к SQLite-базе")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="строк за одну порцию COPY")
+    parser.add_argument('--replace', action='store_true', help="заменить уже существующие данные в PostgreSQL")
+    parser.add_argument('--restart', action='store_true', help="начать заново, игнорируя чекпоинты")
+    args = parser.parse_args()
+    sys.exit(0 if migrate(args.sqlite, args.pg_url, args.chunk, args.replace, args.restart) else 1)
@@ -0,0 +1,59 @@
+"""
+Спільне для тестів: main.py з тимчасовою SQLite-базою замість ~/.gamify
+Запуск: python -m pytest tests
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+
+# main.py створює каталоги в ~/.gamify ще під час імпорту - HOME підміняємо до нього.
+# Дочірні процеси тестів успадковують це оточення
+os.environ['HOME'] = tempfile.mkdtemp(prefix='gamify-test-')
+os.environ.pop('STREAMLIT_SHARING_MODE', None)
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Одноразова база PostgreSQL для тестів режиму IS_CLOUD: схема public перестворюється в кожному тесті
+PG_URL = os.environ.get('GAMIFY_TEST_PG_URL')
+
+import pytest
+
+import main
+
+needs_postgres = pytest.mark.skipif(not PG_URL, reason="нужна одноразовая база PostgreSQL в GAMIFY_TEST_PG_URL")
+
+# Свіжа засіяна схема; conn - з'єднання з нею
+PG_PREAMBLE = """
+import psycopg2
+import main
+reset = psycopg2.connect(main.get_database_url())
+reset.autocommit = True
+reset.cursor().execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+reset.close()
+conn = main.init_database()
+main.seed_data(conn)
+"""
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Свіжа засіяна SQLite-база на тест"""
+    monkeypatch.setattr(main, 'DB_PATH', tmp_path / "xp.db")
+    conn = main.init_database()
+    main.seed_data(conn)
+    yield conn
+    conn.close()
+
+def make_task(front_code='guitar', piece_type='GuitarChunk', date='2026-01-01', status='Done', minutes=10, tier='Daily'):
+    return {'date': date, 'front_code': front_code, 'tier': tier, 'piece_type': piece_type,
+            'note': '', 'minutes': minutes, 'difficulty': 2, 'status': status}
+
+def run_on_postgres(*code):
+    """Код (частини склеюються) в окремому процесі з main.py у режимі PostgreSQL: IS_CLOUD визначається під час імпорту"""
+    env = dict(os.environ, STREAMLIT_SHARING_MODE='1', GAMIFY_PG_URL=PG_URL)
+    result = subprocess.run([sys.executable, '-c', PG_PREAMBLE + ''.join(map(textwrap.dedent, code))], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
@@ -0,0 +1,67 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+import main
+from conftest import make_task
+
+def data_version(conn):
+    c = conn.cursor()
+    c.execute("SELECT version FROM data_version WHERE id = 1")
+    return c.fetchone()[0]
+
+def test_failed_batch_retries_without_duplicates(db, monkeypatch):
+    update_stats = main.update_stats
+    def failing_update_stats(conn, front_code, tier, status, date, delta):
+        if date == '2026-03-03':
+            raise ValueError("bad task")
+        update_stats(conn, front_code, tier, status, date, delta)
+    monkeypatch.setattr(main, 'update_stats', failing_update_stats)
+
+    # Великі задачі, щоб пачка перетнула кілька рівнів
+    tasks = [make_task(date=f"2026-03-{day:02d}", minutes=600, tier='Campaign') for day in range(1, 7)]
+    version = data_version(db)
+
+    async def submit_all():
+        batcher = api.TaskBatcher(api.Pool(2), ThreadPoolExecutor(1))
+        return await asyncio.gather(*(batcher.submit(task) for task in tasks), return_exceptions=True)
+    results = asyncio.run(submit_all())
+
+    assert isinstance(results[2], ValueError)
+    logged = [r for r in results if isinstance(r, dict)]
+    assert len(logged) == 5
+    c = db.cursor()
+    c.execute("SELECT COUNT(*), COUNT(DISTINCT date) FROM tasks")
+    assert c.fetchone() == (5, 5)
+    c.execute("SELECT COALESCE(SUM(amount), 0) FROM coins_log WHERE source = 'levelup'")
+    assert sum(r['bonus'] for r in logged) == c.fetchone()[0] > 0
+    assert math.isclose(main.get_total_coins(db), main.compute_total_coins(db))
+    assert data_version(db) > version
+
+def test_commit_failure_is_not_retried(db, monkeypatch):
+    calls = []
+    def log_tasks(conn, tasks):
+        calls.append(len(tasks))
+        raise api.CommitFailed("connection lost")
+    monkeypatch.setattr(api, 'log_tasks', log_tasks)
+
+    async def submit_all():
+        batcher = api.TaskBatcher(api.Pool(1), ThreadPoolExecutor(1))
+        return await asyncio.gather(*(batcher.submit(make_task()) for _ in range(3)), return_exceptions=True)
+    results = asyncio.run(submit_all())
+
+    assert all(isinstance(r, api.CommitFailed) for r in results)
+    assert calls == [3]
+
+def test_external_write_invalidates_render_cache(db, monkeypatch):
+    # Поза рантаймом Streamlit cache_resource щоразу створює новий кеш
+    cache = main.RenderCache()
+    monkeypatch.setattr(main, 'get_render_cache', lambda: cache)
+    main.check_data_version(db)
+    version = cache.version
+    assert main.check_data_version(db) is False
+    main.bump_data_version(db)
+    db.commit()
+    assert main.check_data_version(db) is True
+    assert cache.version == version + 1
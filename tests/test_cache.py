@@ -0,0 +1,25 @@
+import main
+from conftest import make_task
+
+def test_ui_writes_invalidate_other_processes(db, monkeypatch):
+    # Два серверні процеси на одній БД: у кожного свій кеш рендеру
+    ours, theirs = main.RenderCache(), main.RenderCache()
+    current = {'cache': ours}
+    monkeypatch.setattr(main, 'get_render_cache', lambda: current['cache'])
+    other = main.get_connection()
+    for cache, conn in ((ours, db), (theirs, other)):
+        current['cache'] = cache
+        main.check_data_version(conn)
+
+    current['cache'] = ours
+    main.log_task(db, make_task())
+    version = ours.version
+    # Власний запис кеш уже скинув - наступний прогін не скидає його вдруге
+    assert main.check_data_version(db) is False
+    assert ours.version == version
+
+    current['cache'] = theirs
+    version = theirs.version
+    assert main.check_data_version(other) is True
+    assert theirs.version == version + 1
+    other.close()
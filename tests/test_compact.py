@@ -0,0 +1,79 @@
+import pyarrow.parquet as pq
+import pytest
+
+import compact
+import main
+from conftest import make_task
+
+PIECES = [('guitar', 'GuitarChunk', 'Daily'), ('sport', 'SportWarmup', 'Daily'), ('books', 'BooksChapter', 'Weekly')]
+
+def totals(conn):
+    c = conn.cursor()
+    c.execute("""SELECT front_code, SUM(task_count), SUM(minutes), ROUND(SUM(total_xp), 6), ROUND(SUM(coins_earned), 6)
+                 FROM task_totals GROUP BY front_code ORDER BY front_code""")
+    return c.fetchall()
+
+def tasks(conn, where=''):
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(compact.COLUMNS)} FROM tasks {where} ORDER BY id")
+    return c.fetchall()
+
+@pytest.fixture
+def history(db):
+    for i in range(60):
+        front_code, piece_type, tier = PIECES[i % len(PIECES)]
+        status = 'Failed' if i % 7 == 0 else 'Done'
+        main.log_task(db, dict(make_task(front_code, piece_type, f"2020-{i % 12 + 1:02d}-{i % 28 + 1:02d}", status,
+                                         i % 4 * 15, tier), note=f"старая {i}" if i % 3 else ''))
+    main.log_task(db, make_task(date=main.datetime.now().strftime('%Y-%m-%d')))
+    return db
+
+def test_compact_round_trip(history, tmp_path):
+    dest = tmp_path / "archive"
+    before, balance = totals(history), main.get_total_coins(history)
+    old = tasks(history, "WHERE date < '2021-01-01'")
+
+    archive_id = compact.compact(history, months=12, dest=dest)
+
+    assert totals(history) == before
+    assert main.get_total_coins(history) == balance
+    assert len(tasks(history)) == 1
+    [path] = dest.iterdir()
+    archived = pq.read_table(str(path))
+    assert [tuple(row[col] for col in compact.COLUMNS) for row in archived.to_pylist()] == old
+
+    assert compact.restore(history, archive_id, dest) == len(old)
+    assert tasks(history, "WHERE date < '2021-01-01'") == old
+    assert totals(history) == before
+    assert list(dest.iterdir()) == []
+
+def test_archive_is_written_without_blocking_writers(history, tmp_path, monkeypatch):
+    write_archive = compact.write_archive
+    def write_with_concurrent_log(conn, path, cutoff, max_id):
+        rows = write_archive(conn, path, cutoff, max_id)
+        # Під час запису файлу застосунок пише без очікування; задача пізніша за max_id в архів не потрапляє
+        other = main.get_connection(100)
+        main.log_task(other, make_task(date='2020-06-15'))
+        other.close()
+        return rows
+    monkeypatch.setattr(compact, 'write_archive', write_with_concurrent_log)
+
+    compact.compact(history, months=12, dest=tmp_path / "archive")
+    assert [row[1] for row in tasks(history)] == [main.datetime.now().strftime('%Y-%m-%d'), '2020-06-15']
+
+def test_changes_during_archive_write_abort_compaction(history, tmp_path, monkeypatch):
+    write_archive = compact.write_archive
+    def write_then_delete(conn, path, cutoff, max_id):
+        rows = write_archive(conn, path, cutoff, max_id)
+        other = main.get_connection(100)
+        main.delete_task(other, tasks(other)[0][0])
+        other.close()
+        return rows
+    monkeypatch.setattr(compact, 'write_archive', write_then_delete)
+    before = tasks(history)
+
+    with pytest.raises(RuntimeError, match="изменились"):
+        compact.compact(history, months=12, dest=tmp_path / "archive")
+    assert tasks(history) == before[1:]
+    assert list((tmp_path / "archive").iterdir()) == []
+    assert compact.list_archives(history) == []
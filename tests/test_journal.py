@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+import pytest
+
+import main
+from conftest import make_task
+
+def task_op(op_id, **task):
+    return {'id': op_id, 'kind': 'task', 'at': '2026-01-01T00:00:00', 'payload': make_task(**task)}
+
+def pref_op(op_id):
+    return {'id': op_id, 'kind': 'pref', 'at': '2026-01-01T00:00:00', 'payload': {'key': 'k', 'value': op_id}}
+
+@pytest.fixture
+def journal(tmp_path):
+    return main.WriteJournal(tmp_path / "journal.jsonl")
+
+def test_replay_keeps_ops_while_database_is_locked(db, journal):
+    journal.append(task_op('a1'))
+    holder = main.get_connection()
+    holder.execute("BEGIN IMMEDIATE")
+    conn = main.get_connection(100)
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        journal.replay(conn)
+    assert [op['id'] for op in journal.ops] == ['a1']
+    assert not journal.failed_path.exists()
+
+    holder.rollback()
+    assert journal.replay(conn) == 1
+    assert journal.ops == []
+
+def test_replay_quarantines_rejected_ops(db, journal):
+    # Запит, який БД відхилятиме за будь-якої спроби
+    db.execute("CREATE TRIGGER broken BEFORE INSERT ON user_prefs BEGIN SELECT no_such_column FROM fronts; END")
+    db.commit()
+    for op in (task_op('a1'), pref_op('b2'), task_op('c3', date='2026-01-02')):
+        journal.append(op)
+
+    assert journal.replay(db) == 2
+    assert journal.ops == []
+    failed = [json.loads(line) for line in journal.failed_path.read_text(encoding='utf-8').splitlines()]
+    assert [op['id'] for op in failed] == ['b2']
+    assert 'no such column' in failed[0]['error']
+    assert db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 2
+
+def test_only_connection_failures_count_as_unreachable(tmp_path):
+    with pytest.raises(sqlite3.OperationalError) as missing:
+        sqlite3.connect(tmp_path / "no" / "such" / "dir.db")
+    assert main.db_unreachable(missing.value)
+    locked = sqlite3.OperationalError("database is locked")
+    assert main.db_busy(locked) and not main.db_unreachable(locked)
+    column = sqlite3.OperationalError("no such column: x")
+    assert not main.db_busy(column) and not main.db_unreachable(column)
+
+def test_offline_write_is_journaled_and_replayed_once(db, journal, monkeypatch):
+    monkeypatch.setattr(main, 'get_write_journal', lambda: journal)
+    assert main.write_op(None, 'task', make_task()) is None
+    assert [op['kind'] for op in journal.ops] == ['task']
+    assert db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 0
+
+    op = journal.ops[0]
+    assert journal.replay(db) == 1
+    assert journal.ops == []
+    # Той самий запис ще раз (коміт дійшов, але зв'язок обірвався до відповіді) не дублюється
+    journal.append(op)
+    journal.replay(db)
+    assert db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 1
@@ -0,0 +1,18 @@
+from conftest import needs_postgres, run_on_postgres
+
+@needs_postgres
+def test_rebuild_stats_through_mirror():
+    run_on_postgres("""
+        for day in range(1, 6):
+            main.log_task(conn, {'date': f'2026-01-0{day}', 'front_code': 'guitar', 'tier': 'Daily',
+                                 'piece_type': 'GuitarChunk', 'note': '', 'minutes': 10, 'difficulty': 2, 'status': 'Done'})
+        mirror = main.ReadMirror()
+        mirror.refresh(conn)
+        mirrored = main.MirroredConnection(conn, mirror)
+        balance = main.get_total_coins(conn)
+
+        main.rebuild_stats(mirrored)
+        assert main.get_total_coins(conn) == balance == main.compute_total_coins(conn)
+        assert main.get_total_coins(mirrored) == balance
+        assert main.load_stats(mirrored, 'guitar', '2026-01-05')['current_streak'] == 5
+    """)
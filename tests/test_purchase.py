@@ -0,0 +1,47 @@
+import math
+import multiprocessing
+
+import main
+from conftest import make_task
+
+SESSIONS = 8
+COST = 70
+
+def buy(db_path, attempts, start, results):
+    """Окремий процес зі своїм з'єднанням: attempts покупок підряд після спільного старту"""
+    main.DB_PATH = db_path
+    conn = main.get_connection(60000)
+    start.wait(60)
+    bought = 0
+    for _ in range(attempts):
+        bought += main.purchase_reward(conn, 1, COST)
+    conn.close()
+    results.put(bought)
+
+def test_parallel_purchases_never_overspend(db, tmp_path):
+    for day in range(1, 31):
+        main.log_task(db, make_task(date=f"2026-01-{day:02d}", minutes=30))
+    balance = main.get_total_coins(db)
+    assert math.isclose(balance, main.compute_total_coins(db))
+    expected = math.floor(balance / COST)
+    assert expected > SESSIONS
+
+    # Разом процеси пробують купити більше, ніж дозволяє баланс
+    attempts = expected // SESSIONS + 2
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Barrier(SESSIONS)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=buy, args=(tmp_path / "xp.db", attempts, start, results)) for _ in range(SESSIONS)]
+    for worker in workers:
+        worker.start()
+    bought = sum(results.get(timeout=120) for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    assert bought == expected
+    c = db.cursor()
+    c.execute("SELECT COUNT(*), SUM(coins_spent) FROM purchases")
+    assert c.fetchone() == (expected, expected * COST)
+    assert main.get_total_coins(db) >= 0
+    assert math.isclose(main.get_total_coins(db), balance - expected * COST)
+    assert math.isclose(main.get_total_coins(db), main.compute_total_coins(db))
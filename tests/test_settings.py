@@ -0,0 +1,60 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import main
+
+def piece_types(conn, front_code='guitar'):
+    return main.load_piece_types_frame(conn, front_code)
+
+def test_diff_frames():
+    original = pd.DataFrame({'id': [1, 2, 3], 'code': ['a', 'b', 'c'], 'base_xp': [10, 20, 30]})
+    edited = pd.DataFrame({'id': [1.0, 3.0, np.nan], 'code': ['a', 'c', 'd'], 'base_xp': [10, 35, 40]})
+
+    inserts, updates, deletes = main.diff_frames(original, edited, 'id', ['code', 'base_xp'])
+
+    assert inserts == [('d', 40)]
+    assert updates == [(3, ('c', 35))]
+    assert deletes == [2]
+    # Значення - звичайні Python-типи, які приймають обидва драйвери
+    assert all(type(value) in (str, int) for value in inserts[0] + updates[0][1])
+
+def test_diff_frames_without_changes():
+    original = pd.DataFrame({'id': [1, 2], 'code': ['a', 'b'], 'base_xp': [10, 20]})
+    assert main.diff_frames(original, original.copy(), 'id', ['code', 'base_xp']) == ([], [], [])
+
+def test_save_table_diff(db):
+    pieces = piece_types(db)
+    edited = pieces.copy()
+    edited.loc[0, 'base_xp'] += 5
+    edited = pd.concat([edited.drop(index=1),
+                        pd.DataFrame([{'id': None, 'code': 'GuitarNew', 'name': 'Новая', 'tier': 'Daily', 'base_xp': 15}])],
+                       ignore_index=True)
+
+    inserts, updates, deletes = main.diff_frames(pieces, edited, 'id', main.PIECE_TYPE_COLUMNS)
+    main.save_table_diff(db, 'piece_types', 'id', main.PIECE_TYPE_COLUMNS, inserts, updates, deletes,
+                         extra={'front_code': 'guitar'})
+
+    saved = piece_types(db).set_index('code')
+    assert saved.loc[pieces.loc[0, 'code'], 'base_xp'] == pieces.loc[0, 'base_xp'] + 5
+    assert pieces.loc[1, 'code'] not in saved.index
+    assert saved.loc['GuitarNew', 'name'] == 'Новая'
+
+def test_save_table_diff_rolls_back_on_duplicate_code(db):
+    pieces = piece_types(db)
+    with pytest.raises(sqlite3.IntegrityError):
+        main.save_table_diff(db, 'piece_types', 'id', main.PIECE_TYPE_COLUMNS,
+                             inserts=[(pieces.loc[0, 'code'], 'Дубль', 'Daily', 10)], deletes=[int(pieces.loc[1, 'id'])],
+                             extra={'front_code': 'guitar'})
+    pd.testing.assert_frame_equal(piece_types(db), pieces)
+
+def test_save_button_reruns_without_error():
+    at = AppTest.from_file(str(main.Path(main.__file__)), default_timeout=60)
+    at.run()
+    next(b for b in at.sidebar.button if b.label == "⚙️ Настройки").click().run()
+    next(b for b in at.button if b.label == "Сохранить задачи").click().run()
+    assert not at.exception
+    assert [e.value for e in at.error] == []
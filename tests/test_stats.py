@@ -0,0 +1,130 @@
+import math
+import random
+from datetime import date, timedelta
+
+import main
+from conftest import make_task, needs_postgres, run_on_postgres
+
+PIECES = [('guitar', 'GuitarChunk', 'Daily'), ('guitar', 'GuitarPart', 'Weekly'),
+          ('sport', 'SportWarmup', 'Daily'), ('books', 'BooksChapter', 'Weekly')]
+STATUSES = ['Done', 'Done', 'Done', 'Failed', 'Skipped']
+
+def stats_tables(conn):
+    """Вміст таблиць статистики без порожніх рядків, які інкрементальний шлях лишає після видалень"""
+    c = conn.cursor()
+    c.execute("SELECT scope, tier, status, n FROM stats_tally WHERE n <> 0")
+    tally = sorted(c.fetchall())
+    c.execute("SELECT scope, date, done FROM stats_days")
+    days = sorted(c.fetchall())
+    c.execute("SELECT scope, run_start, run_end, longest FROM stats_streaks WHERE run_end IS NOT NULL")
+    streaks = sorted(c.fetchall())
+    return tally, days, streaks
+
+def assert_matches_rebuild(conn):
+    incremental = stats_tables(conn)
+    balance = main.get_total_coins(conn)
+    main.rebuild_stats(conn)
+    assert stats_tables(conn) == incremental
+    assert math.isclose(main.get_total_coins(conn), balance, abs_tol=1e-6)
+
+def test_incremental_stats_match_rebuild(db):
+    rng = random.Random(33)
+    start = date(2026, 1, 1)
+    c = db.cursor()
+    for step in range(300):
+        action = rng.choices(['log', 'delete', 'buy'], weights=[6, 3, 1])[0]
+        if action == 'log':
+            # Дати вперемішку: записи заднім числом зливають і розривають серії
+            front_code, piece_type, tier = rng.choice(PIECES)
+            day = start + timedelta(days=rng.randrange(40))
+            main.log_task(db, make_task(front_code, piece_type, day.isoformat(), rng.choice(STATUSES),
+                                        rng.choice([0, 10, 30]), tier))
+        elif action == 'delete':
+            c.execute("SELECT id FROM tasks")
+            ids = [row[0] for row in c.fetchall()]
+            if ids:
+                main.delete_task(db, rng.choice(ids))
+        else:
+            main.purchase_reward(db, 1, 200)
+
+        if step % 50 == 49:
+            assert_matches_rebuild(db)
+    assert_matches_rebuild(db)
+
+def test_deleting_middle_day_splits_streak(db):
+    for day in range(1, 6):
+        main.log_task(db, make_task(date=f"2026-02-{day:02d}"))
+    c = db.cursor()
+    c.execute("SELECT id FROM tasks WHERE date = '2026-02-03'")
+    main.delete_task(db, c.fetchone()[0])
+
+    stats = main.load_stats(db, 'guitar', '2026-02-05')
+    assert (stats['current_streak'], stats['longest_streak']) == (2, 2)
+    assert_matches_rebuild(db)
+
+# Знімок таблиць статистики і звірка з повним перерахунком - для коду в процесі з PostgreSQL
+PG_STATS_CHECK = """
+def stats_tables():
+    c = conn.cursor()
+    c.execute("SELECT scope, tier, status, n FROM stats_tally WHERE n <> 0")
+    tally = sorted(c.fetchall())
+    c.execute("SELECT scope, date, done FROM stats_days")
+    days = sorted(c.fetchall())
+    c.execute("SELECT scope, run_start, run_end, longest FROM stats_streaks WHERE run_end IS NOT NULL")
+    return tally, days, sorted(c.fetchall())
+
+def task(date, tier='Daily'):
+    return {'date': date, 'front_code': 'guitar', 'tier': tier, 'piece_type': 'GuitarChunk',
+            'note': '', 'minutes': 10, 'difficulty': 2, 'status': 'Done'}
+"""
+
+@needs_postgres
+def test_concurrent_writers_keep_day_counts():
+    run_on_postgres(PG_STATS_CHECK, """
+        import threading
+        start = threading.Barrier(4)
+
+        # Різні тири - різні рядки stats_tally: записи не серіалізуються на ньому, а сходяться лише в stats_days
+        def writer(k):
+            own = main.get_connection()
+            start.wait()
+            for i in range(30):
+                main.log_task(own, task(f"2026-01-{(i + k) % 4 + 1:02d}", main.TIERS[k]))
+            own.close()
+
+        threads = [threading.Thread(target=writer, args=(k,)) for k in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        incremental = stats_tables()
+        assert [done for scope, date, done in incremental[1] if scope == ''] == [30] * 4
+        main.rebuild_stats(conn)
+        assert stats_tables() == incremental
+    """)
+
+@needs_postgres
+def test_mirrored_writes_see_external_day_counts():
+    run_on_postgres(PG_STATS_CHECK, """
+        main.log_task(conn, task('2026-01-02'))
+        mirror = main.ReadMirror()
+        mirror.refresh(conn)
+        mirrored = main.MirroredConnection(conn, mirror)
+
+        # Запис з іншого процесу (API), якого дзеркало ще не бачило
+        external = main.get_connection()
+        main.log_task(external, task('2026-01-02'))
+        external.close()
+
+        c = conn.cursor()
+        c.execute("SELECT MAX(id) FROM tasks")
+        main.delete_task(mirrored, c.fetchone()[0])
+        main.log_task(mirrored, task('2026-01-01'))
+        main.log_task(mirrored, task('2026-01-03'))
+
+        incremental = stats_tables()
+        assert main.load_stats(conn, 'guitar', '2026-01-03')['current_streak'] == 3
+        main.rebuild_stats(conn)
+        assert stats_tables() == incremental
+    """)
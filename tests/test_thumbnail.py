@@ -0,0 +1,34 @@
+import io
+import logging
+
+import pytest
+from PIL import Image
+
+import main
+
+def palette_with_transparency():
+    image = Image.new('P', (800, 600))
+    image.info['transparency'] = 0
+    return image
+
+@pytest.mark.parametrize('make, ext', [
+    (lambda: Image.new('CMYK', (800, 600), (0, 255, 255, 0)), 'jpg'),
+    (palette_with_transparency, 'gif'),
+    (lambda: Image.new('LA', (800, 600)), 'png'),
+    (lambda: Image.new('RGB', (800, 600), 'red'), 'webp'),
+])
+def test_thumbnail_encodes_any_mode(tmp_path, make, ext):
+    path = tmp_path / f"reward.{ext}"
+    make().save(path)
+    data = main.reward_thumbnail(path)
+    with Image.open(io.BytesIO(data)) as thumb:
+        assert thumb.format == 'PNG'
+        assert max(thumb.size) == main.THUMBNAIL_SIZE
+
+def test_unreadable_image_is_logged(tmp_path, caplog):
+    path = tmp_path / "broken.png"
+    path.write_bytes(b"not an image")
+    with caplog.at_level(logging.WARNING, logger=main.log.name):
+        assert main.reward_thumbnail(path) is None
+    assert str(path) in caplog.text
+    assert main.reward_thumbnail(tmp_path / "missing.png") is None